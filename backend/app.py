@@ -2,11 +2,28 @@
 import os
 import csv
 import json
-from io import StringIO
+import base64
+import hashlib
+import gzip
+import tempfile
+import smtplib
+import sqlite3
+import uuid
+import heapq
+from bisect import bisect_left
+import time
+import threading
+from collections import Counter, OrderedDict, deque
+from itertools import count, groupby, islice, repeat
+import click
 from datetime import datetime as DateTime, date as Date, time as Time
-from flask import Flask, jsonify, render_template, request, send_from_directory
+from flask import Blueprint, Flask, current_app, g, jsonify, render_template, request, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import and_, case, create_engine, delete, event, func, insert, literal, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased, joinedload, object_session
+from sqlalchemy.exc import IntegrityError
 from flask_jwt_extended import (
     JWTManager,
     create_access_token,
@@ -16,50 +33,198 @@ from flask_jwt_extended import (
 )
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from flask_cors import CORS
 from flask_caching import Cache
 from flask_mail import Mail, Message
-from celery import Celery
+from jinja2 import Template
+from celery import Celery, Task, group
 from celery.schedules import crontab
 
 # Import models from models.py (assumed to exist)
 # models.py should define: db, User, DoctorProfile, PatientProfile, Appointment, Treatment
 from models import db, User, DoctorProfile, PatientProfile, Appointment, Treatment,Department
+from models import DoctorAvailability, AvailabilityVersion
+from models import StatCounter, AppointmentDailyStat, EmailOutbox, WorkingHours
+from slots import LABEL_FORMAT, slot_bit, bitmap_times, free_slot_days, day_grid, parse_breaks, format_breaks, schedule_as_dict, schedule_for, schedules_for
+from functools import lru_cache, wraps
+
+# optional speed-ups, used when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+# only needed when SLOT_EVENTS_REDIS_URL is set
+try:
+    import redis
+except ImportError:
+    redis = None
 
 # ---------------------------
 # App & config
 # ---------------------------
-app = Flask(
-    __name__,
-    template_folder="../frontend",  # adjust if needed
-    static_folder="../frontend",
-    static_url_path="/static",
-)
+bp = Blueprint("hms", __name__, cli_group=None)
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that writes dates and times as ISO 8601.
+
+    Serializes with orjson when it is installed and with the standard
+    library otherwise; both produce the same values.
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (Date, Time)):  # datetime is a date subclass
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        # response() passes indent=2 in debug and compact separators otherwise;
+        # orjson is compact by default, anything else goes to the stdlib
+        indent = kwargs.get("indent")
+        if orjson is None or set(kwargs) - {"indent", "separators"} or indent not in (None, 2):
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+# extensions are bound to the app in create_app()
+jwt = JWTManager()
+cache = Cache()
+mail = Mail()
+
+
+def database_url():
+    url = os.environ.get("DATABASE_URL", "sqlite:///hospital.db")
+    # some hosts still hand out the pre-1.4 "postgres://" scheme
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def engine_options(config):
+    """Pool settings for server databases; SQLite keeps SQLAlchemy's defaults."""
+    if config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": True,
+    }
+
+
+def configure_sqlite(engine, config):
+    """Set per-connection pragmas so readers don't block the writer and writers wait instead of failing."""
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+        cursor.execute("PRAGMA synchronous=NORMAL")  # durable in WAL mode except on power loss
+        cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+        cursor.execute(f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}")
+        cursor.close()
+
+
+def create_app(config=None):
+    """Build the Flask app and wire extensions, routes and Celery to it.
+
+    Building the app does not touch the database, so importing this module
+    (Celery workers, beat, gunicorn workers, the flask CLI) is cheap. Schema
+    creation and data migrations run from `flask init-db`, from `python app.py`,
+    or here when INIT_DB_ON_STARTUP=1.
+    """
+    app = Flask(
+        __name__,
+        template_folder="../frontend",  # adjust if needed
+        static_folder="../frontend",
+        static_url_path="/static",
+    )
+
+    # --- Basic config (tweak for production) ---
+    # Database: DATABASE_URL for server databases, otherwise a local SQLite file
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url()
+    app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    app.config["SQLITE_MMAP_SIZE"] = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+    app.config["SQLITE_CACHE_SIZE_KB"] = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+    app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", 10))
+    app.config["DB_MAX_OVERFLOW"] = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+    app.config["DB_POOL_TIMEOUT"] = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+    app.config["DB_POOL_RECYCLE"] = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    # Optional read replica: GET requests and read-only tasks query it. A SQLite
+    # replica file is refreshed from the primary every REPLICA_SYNC_SECONDS.
+    if os.environ.get("REPLICA_DATABASE_URL"):
+        app.config["SQLALCHEMY_BINDS"] = {"replica": os.environ["REPLICA_DATABASE_URL"]}
+    app.config["REPLICA_SYNC_SECONDS"] = int(os.environ.get("REPLICA_SYNC_SECONDS", 30))
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["JWT_SECRET_KEY"] = "change_this_to_a_real_secret"  # set a secure key
+    # Celery / Redis (adjust broker/backend if needed)
+    app.config["broker_url"] = "redis://localhost:6379/0"
+    app.config["result_backend"] = "redis://localhost:6379/0"
+    # Cache (optional)
+    app.config["CACHE_TYPE"] = "SimpleCache"  # or RedisCache in prod
+    app.config["CACHE_DEFAULT_TIMEOUT"] = 60
+    app.config["CATALOG_CACHE_TIMEOUT"] = 300  # departments / department doctor lists
+    # gzip / brotli for API responses at least this many bytes long
+    app.config["COMPRESS_MIN_SIZE"] = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+    app.config["COMPRESS_LEVEL"] = int(os.environ.get("COMPRESS_LEVEL", 6))
+    # set to fan slot change events out to every web process (see SlotEventBroker)
+    app.config["SLOT_EVENTS_REDIS_URL"] = os.environ.get("SLOT_EVENTS_REDIS_URL")
+    # lifetime of the ?token= that opens a slot event stream (see stream_token_required)
+    app.config["SLOT_EVENTS_TOKEN_SECONDS"] = int(os.environ.get("SLOT_EVENTS_TOKEN_SECONDS", 60))
+    # blocking or un-approving a user rejects their existing tokens within this many seconds
+    app.config["ACCOUNT_STATE_TTL"] = int(os.environ.get("ACCOUNT_STATE_TTL", 5))
+    # Password hashing: any werkzeug method string, e.g. "scrypt:32768:8:1" or
+    # "pbkdf2:sha256:600000". Stored hashes are upgraded on the next successful login.
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    # Mail (configure for your provider)
+    app.config["MAIL_SERVER"] = "smtp.example.com"
+    app.config["MAIL_PORT"] = 587
+    app.config["MAIL_USE_TLS"] = True
+    app.config["MAIL_USERNAME"] = "your_email@example.com"
+    app.config["MAIL_PASSWORD"] = "your_password"
+    app.config["MAIL_DEFAULT_SENDER"] = "your_email@example.com"
+    app.config["INIT_DB_ON_STARTUP"] = os.environ.get("INIT_DB_ON_STARTUP", "0") == "1"
+    if config:
+        app.config.update(config)
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
+
+    app.json = JSONProvider(app)
+
+    # init extensions
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "sqlite":
+                configure_sqlite(engine, app.config)
+    jwt.init_app(app)
+    cache.init_app(app)
+    mail.init_app(app)
+    SLOT_EVENTS.init_app(app)
+    ACCOUNT_STATE.ttl = app.config["ACCOUNT_STATE_TTL"]
+    CORS(app)
+    app.register_blueprint(bp)
+    init_celery(app)
+
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    if app.config["INIT_DB_ON_STARTUP"]:
+        with app.app_context():
+            init_db_and_admin()
+    return app
+
 
-# --- Basic config (tweak for production) ---
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///hospital.db"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["JWT_SECRET_KEY"] = "change_this_to_a_real_secret"  # set a secure key
-# Celery / Redis (adjust broker/backend if needed)
-app.config["broker_url"] = "redis://localhost:6379/0"
-app.config["result_backend"] = "redis://localhost:6379/0"
-# Cache (optional)
-app.config["CACHE_TYPE"] = "SimpleCache"  # or RedisCache in prod
-app.config["CACHE_DEFAULT_TIMEOUT"] = 60
-# Mail (configure for your provider)
-app.config["MAIL_SERVER"] = "smtp.example.com"
-app.config["MAIL_PORT"] = 587
-app.config["MAIL_USE_TLS"] = True
-app.config["MAIL_USERNAME"] = "your_email@example.com"
-app.config["MAIL_PASSWORD"] = "your_password"
-app.config["MAIL_DEFAULT_SENDER"] = "your_email@example.com"
-
-# init extensions
-db.init_app(app)
-jwt = JWTManager(app)
-cache = Cache(app)
-mail = Mail(app)
-CORS(app)
 def appointment_to_dict(a):
     """Return a JSON-serializable dict for an Appointment object."""
     return {
@@ -69,64 +234,136 @@ def appointment_to_dict(a):
         "doctor_name": a.doctor.username if getattr(a, "doctor", None) else None,
         "department_id": a.department_id,
         "department_name": a.department.name if getattr(a, "department", None) else None,
-        # date as ISO yyyy-mm-dd (string)
-        "date": a.date.isoformat() if a.date else None,
-        # time as hh:mm:ss (string) — change format if you prefer e.g. "%I:%M %p"
-        "time": a.time.strftime("%H:%M:%S") if a.time else None,
+        # date as ISO yyyy-mm-dd, time as hh:mm:ss (the JSON provider formats both)
+        "date": a.date,
+        "time": a.time,
         "status": a.status,
         "remarks": a.remarks,
     }
 
 # ---------------------------
-# Celery factory
+# Celery
 # ---------------------------
-def make_celery(flask_app):
-    celery = Celery(
-        flask_app.import_name,
-        backend=flask_app.config.get("result_backend"),
-        broker=flask_app.config.get("broker_url"),
-    )
-    celery.conf.update(flask_app.config)
+class ContextTask(Task):
+    """Run every task inside the app context of the Flask app Celery was bound to."""
 
-    class ContextTask(celery.Task):
-        def __call__(self, *args, **kwargs):
-            with flask_app.app_context():
-                return super().__call__(*args, **kwargs)
+    def __call__(self, *args, **kwargs):
+        with self.app.flask_app.app_context():
+            return super().__call__(*args, **kwargs)
 
-    celery.Task = ContextTask
-    return celery
 
+celery = Celery(__name__, task_cls=ContextTask)
+
+
+def init_celery(flask_app):
+    celery.conf.update(flask_app.config)
+    celery.flask_app = flask_app
+    replica_url = flask_app.config.get("SQLALCHEMY_BINDS", {}).get("replica")
+    if replica_url and str(replica_url).startswith("sqlite"):
+        celery.conf.beat_schedule["sync-sqlite-replica"] = {
+            "task": "tasks.sync_sqlite_replica",
+            "schedule": float(flask_app.config["REPLICA_SYNC_SECONDS"]),
+        }
 
-celery = make_celery(app)
 
-# Ensure reports dir exists
-REPORTS_DIR = os.path.join(app.root_path, "reports")
-os.makedirs(REPORTS_DIR, exist_ok=True)
+REPORTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports")
 
 # ---------------------------
 # Create DB + default admin
 # ---------------------------
-first_request = True
+def init_db_and_admin():
+    """Create tables, the default admin and run data migrations; safe to re-run."""
+    db.create_all()
+    # default admin (only created if missing)
+    if not User.query.filter_by(role="admin").first():
+        admin = User(
+            username="admin@hms.com",
+            password=hash_password("admin123"),
+            role="admin",
+            approve=True,
+            blocked=False,
+        )
+        db.session.add(admin)
+        db.session.commit()
+    ensure_indexes()
+    migrate_availability_json()
+    if not db.session.query(StatCounter.query.exists()).scalar():
+        rebuild_dashboard_counters()
+    sync_sqlite_replica()
+
+
+def duplicate_bookings():
+    """Booked rows sharing a doctor slot with an earlier Booked row, oldest id first.
+
+    Databases written before uq_appointments_booked_slot existed can hold such
+    rows, and the unique index cannot be created until they are resolved.
+    """
+    duplicates = (
+        db.session.query(Appointment.doctor_id, Appointment.date, Appointment.time)
+        .filter(Appointment.status == "Booked", Appointment.doctor_id.isnot(None))
+        .group_by(Appointment.doctor_id, Appointment.date, Appointment.time)
+        .having(func.count(Appointment.id) > 1)
+        .all()
+    )
+    extra = []
+    for doctor_id, date_obj, time_obj in duplicates:
+        rows = (
+            Appointment.query.filter_by(doctor_id=doctor_id, date=date_obj, time=time_obj, status="Booked")
+            .order_by(Appointment.id)
+            .all()
+        )
+        extra.extend(rows[1:])
+    return extra
 
 
-@app.before_request
-def init_db_and_admin():
-    global first_request
-    if first_request:
-        db.create_all()
-        # default admin (only created on first request if missing)
-        if not User.query.filter_by(role="admin").first():
-            admin = User(
-                username="admin@hms.com",
-                password=generate_password_hash("admin123"),
-                role="admin",
-                approve=True,
-                blocked=False,
-            )
-            db.session.add(admin)
-            db.session.commit()
-        os.makedirs(REPORTS_DIR, exist_ok=True)
-        first_request = False
+def cancel_duplicate_bookings(appts):
+    """Cancel the rows returned by duplicate_bookings() and commit."""
+    for appt in appts:
+        appt.status = "Cancelled"
+        appt.remarks = "Duplicate booking cancelled by migration"
+    for doctor_id in {appt.doctor_id for appt in appts}:
+        bump_availability_version(doctor_id)
+    db.session.commit()
+    if db.session.query(StatCounter.query.exists()).scalar():
+        rebuild_dashboard_counters()
+
+
+def sync_sqlite_replica():
+    """Copy the primary SQLite database into the replica file with SQLite's backup API.
+
+    Returns False when there is no replica or either side is not SQLite
+    (server replicas are kept in sync by the database itself).
+    """
+    replica = db.engines.get("replica")
+    primary = db.engines[None]
+    if replica is None or primary.dialect.name != "sqlite" or replica.dialect.name != "sqlite":
+        return False
+    src = sqlite3.connect(primary.url.database)
+    dst = sqlite3.connect(replica.url.database)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    return True
+
+
+def ensure_indexes():
+    """Create model indexes missing from an existing database.
+
+    db.create_all() only creates indexes together with new tables, so
+    databases created before an index was declared need this pass.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=db.engine, checkfirst=True)
+            except IntegrityError:
+                # e.g. duplicate Booked rows predating uq_appointments_booked_slot
+                current_app.logger.warning(
+                    "Could not create index %s: existing rows violate it (see flask cancel-duplicate-bookings)",
+                    index.name,
+                )
 
 
 # ---------------------------
@@ -144,10 +381,1150 @@ def is_patient_claims(claims):
     return claims.get("role") == "patient"
 
 
+def use_primary(view):
+    """Keep a GET endpoint on the primary, for pages that must show the caller's own writes."""
+    view.use_primary = True
+    return view
+
+
+@bp.before_request
+def route_reads_to_replica():
+    # GET/HEAD only read, so they may use the replica bind (see RoutingSession).
+    # The replica lags by up to REPLICA_SYNC_SECONDS, so only reads that
+    # tolerate that (reports, dashboards, history) go there; pages re-read right
+    # after the caller's own booking, cancel or edit are marked @use_primary.
+    view = current_app.view_functions.get(request.endpoint)
+    g.use_replica = request.method in ("GET", "HEAD") and not getattr(view, "use_primary", False)
+
+
+def parse_date_arg(name, default=None):
+    """Read a YYYY-MM-DD query parameter; raises ValueError on bad input."""
+    value = request.args.get(name)
+    if not value:
+        return default
+    return DateTime.strptime(value, "%Y-%m-%d").date()
+
+
+def parse_bool_arg(name):
+    """Read a true/false query parameter; None when absent, ValueError otherwise."""
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    value = value.strip().lower()
+    if value in ("true", "1", "yes"):
+        return True
+    if value in ("false", "0", "no"):
+        return False
+    raise ValueError(name)
+
+
+def parse_int_arg(name, default=None):
+    """Read an integer query parameter; default when absent, ValueError otherwise."""
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+def parse_id(value):
+    """Coerce a JSON body id (int or digit string) to a positive int; ValueError otherwise."""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"not an id: {value!r}")
+    value = int(value)
+    if value < 1:
+        raise ValueError(f"not an id: {value!r}")
+    return value
+
+
+# ---------------------------
+# Dashboard counters
+# ---------------------------
+def _increment(table, keys, column, delta):
+    """Add delta to table.column for the row identified by keys, creating it if missing."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        upsert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        db.session.execute(
+            upsert(table)
+            .values(**keys, **{column: delta})
+            .on_conflict_do_update(
+                index_elements=list(keys),
+                set_={column: getattr(table.c, column) + delta},
+            )
+        )
+        return
+    where = [getattr(table.c, k) == v for k, v in keys.items()]
+    result = db.session.execute(
+        update(table).where(*where).values({column: getattr(table.c, column) + delta})
+    )
+    if not result.rowcount:
+        db.session.execute(insert(table).values(**keys, **{column: delta}))
+
+
+def _increment_many(table, deltas, column):
+    """_increment for several rows at once; deltas maps key tuples (in table key order) to amounts."""
+    key_columns = [c.name for c in table.primary_key.columns]
+    rows = [{**dict(zip(key_columns, key)), column: delta} for key, delta in deltas.items() if delta]
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        upsert = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(table).values(rows)
+        db.session.execute(
+            upsert.on_conflict_do_update(
+                index_elements=key_columns,
+                set_={column: getattr(table.c, column) + getattr(upsert.excluded, column)},
+            )
+        )
+        return
+    for row in rows:
+        _increment(table, {k: row[k] for k in key_columns}, column, row[column])
+
+
+def count_user(role, delta=1):
+    """Track a created (+1) or deleted (-1) user; runs in the caller's transaction."""
+    _increment(StatCounter.__table__, {"name": f"users:{role}"}, "value", delta)
+
+
+def count_appointment(appt, status, delta=1):
+    """Track an appointment entering (+1) or leaving (-1) a status."""
+    _increment(
+        AppointmentDailyStat.__table__,
+        {"date": appt.date, "department_id": appt.department_id or 0, "status": status},
+        "count",
+        delta,
+    )
+
+
+def count_appointments(dates, department_id, status):
+    """count_appointment for a batch of new appointments in one department, in one statement."""
+    _increment_many(
+        AppointmentDailyStat.__table__,
+        Counter((appt_date, department_id or 0, status) for appt_date in dates),
+        "count",
+    )
+
+
+def rebuild_dashboard_counters():
+    """Recompute stat_counters and appointment_daily_stats from the source tables."""
+    db.session.execute(delete(StatCounter))
+    db.session.execute(delete(AppointmentDailyStat))
+    db.session.execute(
+        insert(StatCounter).from_select(
+            ["name", "value"],
+            db.select(literal("users:") + User.role, func.count(User.id)).group_by(User.role),
+        )
+    )
+    db.session.execute(
+        insert(AppointmentDailyStat).from_select(
+            ["date", "department_id", "status", "count"],
+            db.select(
+                Appointment.date,
+                func.coalesce(Appointment.department_id, 0),
+                Appointment.status,
+                func.count(Appointment.id),
+            )
+            .filter(Appointment.date.isnot(None), Appointment.status.isnot(None))
+            .group_by(Appointment.date, func.coalesce(Appointment.department_id, 0), Appointment.status),
+        )
+    )
+    db.session.commit()
+
+
+# ---------------------------
+# Passwords and login metrics
+# ---------------------------
+METRICS = {
+    "password_checks": 0,
+    "password_check_cpu_seconds": 0.0,
+    "password_rehashes": 0,
+    "slot_occupancy_hits": 0,
+    "slot_occupancy_misses": 0,
+}
+_metrics_lock = threading.Lock()
+
+
+def record_metric(name, value=1):
+    with _metrics_lock:
+        METRICS[name] = METRICS.get(name, 0) + value
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=current_app.config["PASSWORD_HASH_METHOD"])
+
+
+@lru_cache(maxsize=8)
+def _hash_prefix(method):
+    """Parameter prefix werkzeug writes for `method` (defaults filled in), e.g. "scrypt:32768:8:1"."""
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
+def verify_password(user, password):
+    """Check a login password and record the CPU time it took.
+
+    On success, a hash made with a different method or work factor than
+    PASSWORD_HASH_METHOD is replaced (and committed) with one that matches.
+    """
+    started = time.thread_time()
+    ok = check_password_hash(user.password, password)
+    record_metric("password_checks")
+    record_metric("password_check_cpu_seconds", time.thread_time() - started)
+    if ok and user.password.split("$", 1)[0] != _hash_prefix(current_app.config["PASSWORD_HASH_METHOD"]):
+        user.password = hash_password(password)
+        db.session.commit()
+        record_metric("password_rehashes")
+    return ok
+
+
+# ---------------------------
+# In-process LRU cache with per-entry expiry
+# ---------------------------
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """Unexpired (key, value) pairs, without touching their LRU position."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (value, expires) in self._data.items() if expires > now]
+
+
+# ---------------------------
+# Account state: reject tokens of blocked / unapproved users
+# ---------------------------
+# user id -> True if that user's tokens must be rejected; create_app sets the
+# TTL from ACCOUNT_STATE_TTL
+ACCOUNT_STATE = TTLCache(maxsize=10000, ttl=None)
+
+
+def token_user_id(claims):
+    return claims.get("user_id") or claims.get("admin_user_id")
+
+
+@jwt.token_in_blocklist_loader
+def account_token_revoked(jwt_header, jwt_payload):
+    """Called by @jwt_required on every request; hits the database once per user per TTL."""
+    user_id = token_user_id(jwt_payload)
+    if user_id is None:
+        return False
+    revoked = ACCOUNT_STATE.get(user_id)
+    if revoked is None:
+        # read from the primary so a block is never hidden by replica lag
+        row = db.session.execute(
+            db.select(User.role, User.approve, User.blocked).where(User.id == user_id),
+            bind_arguments={"bind": db.engine},
+        ).first()
+        revoked = row is None or bool(row.blocked) or (row.role == "doctor" and not row.approve)
+        ACCOUNT_STATE.set(user_id, revoked)
+    return revoked
+
+
+@jwt.revoked_token_loader
+def account_token_revoked_response(jwt_header, jwt_payload):
+    return jsonify({"category": "danger", "message": "Account blocked or not approved"}), 401
+
+
+def invalidate_account(user_id):
+    """Drop the cached state so this process re-checks the user on the next request."""
+    ACCOUNT_STATE.pop(user_id)
+
+
+# ---------------------------
+# Email outbox: request handlers queue mail, Celery delivers it
+# ---------------------------
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_RETRY_BASE_SECONDS = 30  # doubled after every failed attempt
+OUTBOX_RECONNECTS = 2  # per run, when the SMTP server drops the connection mid-batch
+OUTBOX_CLAIM_SECONDS = 300  # a claimed row is re-sent if its worker dies mid-send
+OUTBOX_DRAIN_LIMIT = 200
+
+
+def queue_email(recipient, subject, body=None, html=None):
+    """Add an outbox row to the current session; it is only sent once the caller commits."""
+    email = EmailOutbox(recipient=recipient, subject=subject, body=body, html=html,
+                        next_attempt_at=DateTime.now())
+    db.session.add(email)
+    return email
+
+
+def dispatch_outbox(ids):
+    """Ask a worker to send the given rows now; the periodic drain covers a broker outage."""
+    try:
+        deliver_outbox.delay(ids)
+    except Exception as e:
+        current_app.logger.warning("Could not queue outbox delivery for %s: %s", ids, e)
+
+
+# ---------------------------
+# Conditional GET (ETag / If-None-Match)
+# ---------------------------
+def etag_of(payload):
+    """Strong ETag for a JSON-serializable payload."""
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def conditional_json(etag, build):
+    """304 if the client already holds `etag`, otherwise jsonify(build()); build() is skipped on a match."""
+    # compress_response() gives each encoding its own tag, e.g. "<etag>-gzip"
+    for held in (etag, *(etag + suffix for suffix in ENCODING_ETAG_SUFFIXES.values())):
+        if request.if_none_match.contains(held):
+            resp = current_app.response_class(status=304)
+            resp.set_etag(held)
+            break
+    else:
+        resp = jsonify(build())
+        resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"  # always revalidate
+    return resp
+
+
+# ---------------------------
+# Response compression
+# ---------------------------
+ENCODING_ETAG_SUFFIXES = {"br": "-br", "gzip": "-gzip"}
+
+
+def choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+@bp.after_request
+def compress_response(resp):
+    """Compress successful responses above COMPRESS_MIN_SIZE with brotli or gzip."""
+    if (
+        resp.status_code != 200
+        or resp.direct_passthrough
+        or "Content-Encoding" in resp.headers
+        or (resp.content_length or 0) < current_app.config["COMPRESS_MIN_SIZE"]
+    ):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    encoding = choose_encoding()
+    if encoding is None:
+        return resp
+    level = current_app.config["COMPRESS_LEVEL"]
+    data = resp.get_data()
+    if encoding == "br":
+        resp.set_data(brotli.compress(data, quality=min(level, 11)))
+    else:
+        resp.set_data(gzip.compress(data, compresslevel=level))
+    resp.headers["Content-Encoding"] = encoding
+    # a strong ETag names exact bytes, so each encoding gets its own
+    etag, weak = resp.get_etag()
+    if etag and not weak:
+        resp.set_etag(etag + ENCODING_ETAG_SUFFIXES[encoding])
+    return resp
+
+
+# ---------------------------
+# Catalog cache: departments and the approved doctors in each
+# ---------------------------
+CATALOG_VERSION_KEY = "catalog:version"
+
+
+def catalog_key(name):
+    """Cache key for a catalog entry under the current catalog version."""
+    return f"catalog:{cache.get(CATALOG_VERSION_KEY) or 0}:{name}"
+
+
+def invalidate_catalog():
+    """Drop every cached catalog entry by moving to a new catalog version.
+
+    Call after any change to departments or to which doctors a department
+    lists (create, approve, block, delete, specialization/experience edits).
+    """
+    version = (cache.get(CATALOG_VERSION_KEY) or 0) + 1
+    cache.set(CATALOG_VERSION_KEY, version, timeout=0)  # never expires
+
+
+def cached_departments():
+    """(departments, etag); the ETag is computed once per cache fill."""
+    key = catalog_key("departments")
+    entry = cache.get(key)
+    if entry is None:
+        departments = [
+            {"id": d.id, "name": d.name, "description": d.description}
+            for d in Department.query.order_by(Department.id).all()
+        ]
+        entry = (departments, etag_of(departments))
+        cache.set(key, entry, timeout=current_app.config["CATALOG_CACHE_TIMEOUT"])
+    return entry
+
+
+def cached_department_details(dept_id):
+    """({"department": ..., "doctors": [...]}, etag), or (None, None) if the department does not exist."""
+    key = catalog_key(f"department:{dept_id}")
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    dept = db.session.get(Department, dept_id)
+    if not dept:
+        return None, None
+
+    # Get doctors who specialize in this department
+    doctors = (
+        db.session.query(User, DoctorProfile)
+        .join(DoctorProfile, DoctorProfile.user_id == User.id)
+        .filter(
+            User.role == "doctor",
+            User.approve == True,
+            DoctorProfile.specialization_id == dept_id
+        )
+        .all()
+    )
+
+    details = {
+        "department": {
+            "id": dept.id,
+            "name": dept.name,
+            "description": dept.description
+        },
+        "doctors": [
+            {"id": user.id, "name": user.username, "experience": profile.experience}
+            for user, profile in doctors
+        ],
+    }
+    entry = (details, etag_of(details))
+    cache.set(key, entry, timeout=current_app.config["CATALOG_CACHE_TIMEOUT"])
+    return entry
+
+
+# departments can also be added outside the API (flask shell, seed scripts using the ORM);
+# these fire during flush, so only mark the session and invalidate once it commits,
+# otherwise a concurrent reader could re-cache the pre-commit rows
+@event.listens_for(Department, "after_insert")
+@event.listens_for(Department, "after_update")
+@event.listens_for(Department, "after_delete")
+def _department_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["catalog_changed"] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_catalog_on_commit(session):
+    if session.info.pop("catalog_changed", False):
+        invalidate_catalog()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_catalog_change(session):
+    session.info.pop("catalog_changed", None)
+
+
+# ---------------------------
+# Keyset pagination for appointment lists
+# ---------------------------
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
+
+
+def encode_cursor(appt):
+    raw = f"{appt.date.isoformat()}|{appt.time.strftime('%H:%M:%S')}|{appt.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (date, time, id) from a cursor; raises ValueError if malformed."""
+    try:
+        date_str, time_str, appt_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    except (UnicodeError, ValueError, base64.binascii.Error):
+        raise ValueError("invalid cursor")
+    return (
+        DateTime.strptime(date_str, "%Y-%m-%d").date(),
+        DateTime.strptime(time_str, "%H:%M:%S").time(),
+        int(appt_id),
+    )
+
+
+def paginate_appointments(query, descending=False, default_from=None):
+    """Apply ?status=&from=&to=&cursor=&limit= to an Appointment query.
+
+    Results are ordered by (date, time, id) and the cursor is the last row of
+    the previous page, so each page is an index range scan no matter how deep
+    the client pages. default_from applies when ?from= is absent, and then
+    only to rows that are no longer Booked: an earlier visit that still needs
+    completing stays listed, ahead of today's. Returns (rows, next_cursor);
+    raises ValueError on bad args.
+    """
+    limit = parse_int_arg("limit", PAGE_SIZE_DEFAULT)
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+
+    status = request.args.get("status")
+    if status:
+        query = query.filter(Appointment.status == status)
+    date_from = parse_date_arg("from")
+    if date_from:
+        query = query.filter(Appointment.date >= date_from)
+    elif default_from:
+        query = query.filter(or_(Appointment.date >= default_from, Appointment.status == "Booked"))
+    date_to = parse_date_arg("to")
+    if date_to:
+        query = query.filter(Appointment.date <= date_to)
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        c_date, c_time, c_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(or_(
+                Appointment.date < c_date,
+                and_(Appointment.date == c_date, Appointment.time < c_time),
+                and_(Appointment.date == c_date, Appointment.time == c_time, Appointment.id < c_id),
+            ))
+        else:
+            query = query.filter(or_(
+                Appointment.date > c_date,
+                and_(Appointment.date == c_date, Appointment.time > c_time),
+                and_(Appointment.date == c_date, Appointment.time == c_time, Appointment.id > c_id),
+            ))
+
+    if descending:
+        query = query.order_by(Appointment.date.desc(), Appointment.time.desc(), Appointment.id.desc())
+    else:
+        query = query.order_by(Appointment.date.asc(), Appointment.time.asc(), Appointment.id.asc())
+
+    # fetch one extra row to know whether there is a next page
+    rows = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+# ---------------------------
+# Slot helpers
+# ---------------------------
+def available_days_query(date_from, date_to=None):
+    """DoctorAvailability rows marked available in [date_from, date_to]."""
+    query = DoctorAvailability.query.filter(
+        DoctorAvailability.available == True,
+        DoctorAvailability.date >= date_from,
+    )
+    if date_to is not None:
+        query = query.filter(DoctorAvailability.date <= date_to)
+    return query
+
+
+def parse_availability(value):
+    """Parse a {"YYYY-MM-DD": bool} mapping (dict or JSON string) into {date: bool}.
+
+    Values may also be {"available": bool, "start": "HH:MM", "end": "HH:MM"}
+    to override the doctor's working hours for that day; times left out come
+    back as None and are filled in by save_doctor_availability. Raises ValueError.
+    """
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, dict):
+        raise ValueError("availability must be a mapping of dates")
+    parsed = {}
+    for date_str, entry in value.items():
+        date_obj = DateTime.strptime(date_str, "%Y-%m-%d").date()
+        if isinstance(entry, dict):
+            start = DateTime.strptime(entry["start"], "%H:%M").time() if entry.get("start") else None
+            end = DateTime.strptime(entry["end"], "%H:%M").time() if entry.get("end") else None
+            if start and end and start >= end:
+                raise ValueError(f"start must be before end on {date_str}")
+            parsed[date_obj] = (bool(entry.get("available", True)), start, end)
+        else:
+            parsed[date_obj] = (bool(entry), None, None)
+    return parsed
+
+
+def save_doctor_availability(doctor_id, parsed):
+    """Upsert DoctorAvailability rows for the given {date: (available, start, end)}.
+
+    Missing start/end times come from the doctor's working hours. Only the
+    dates present in ``parsed`` are touched; the caller commits. Raises
+    ValueError if a resulting day would end before it starts.
+    """
+    if not parsed:
+        return
+    if any(start is None or end is None for _, start, end in parsed.values()):
+        schedule = schedule_for(doctor_id)
+        parsed = {
+            date_obj: (available, start or schedule.day_start, end or schedule.day_end)
+            for date_obj, (available, start, end) in parsed.items()
+        }
+    for date_obj, (_, start, end) in parsed.items():
+        if start >= end:
+            raise ValueError(f"start must be before end on {date_obj.isoformat()}")
+    bump_availability_version(doctor_id)
+    existing = {
+        row.date: row
+        for row in DoctorAvailability.query.filter(
+            DoctorAvailability.doctor_id == doctor_id,
+            DoctorAvailability.date.in_(list(parsed)),
+        )
+    }
+    for date_obj, (available, start, end) in parsed.items():
+        row = existing.get(date_obj)
+        if row is None:
+            row = DoctorAvailability(doctor_id=doctor_id, date=date_obj)
+            db.session.add(row)
+        row.available = available
+        row.start_time = start
+        row.end_time = end
+
+
+def availability_json(doctor_id):
+    """Upcoming doctor_availability rows as the JSON date map profile clients edit."""
+    rows = DoctorAvailability.query.filter(
+        DoctorAvailability.doctor_id == doctor_id,
+        DoctorAvailability.date >= DateTime.now().date(),
+    ).order_by(DoctorAvailability.date)
+    return json.dumps({
+        row.date.isoformat(): {
+            "available": row.available,
+            "start": row.start_time.strftime("%H:%M"),
+            "end": row.end_time.strftime("%H:%M"),
+        }
+        for row in rows
+    })
+
+
+def sync_profile_availability(doctor_id, availability, previous=None):
+    """Apply a JSON date map sent to a profile endpoint to doctor_availability.
+
+    doctor_availability is the only record of availability, so only what the
+    client actually changed is written: a map equal to `previous` (the legacy
+    DoctorProfile.availability text) is ignored, and so are dates that already
+    match their row. Re-posting an old map therefore cannot undo the doctor's
+    own edits through POST /doctor/availability.
+    """
+    if not availability or doctor_id is None:
+        return
+    try:
+        parsed = parse_availability(availability)
+        if previous and parse_availability(previous) == parsed:
+            return
+    except (ValueError, TypeError):
+        # free-text availability notes are not availability
+        return
+    rows = {
+        row.date: row
+        for row in DoctorAvailability.query.filter(
+            DoctorAvailability.doctor_id == doctor_id,
+            DoctorAvailability.date.in_(list(parsed)),
+        )
+    }
+
+    def unchanged(row, available, start, end):
+        return (
+            row is not None
+            and row.available == available
+            and start in (None, row.start_time)
+            and end in (None, row.end_time)
+        )
+
+    changed = {
+        date_obj: day for date_obj, day in parsed.items() if not unchanged(rows.get(date_obj), *day)
+    }
+    try:
+        save_doctor_availability(doctor_id, changed)
+    except ValueError:
+        return
+
+
+def migrate_availability_json():
+    """One-off copy of legacy DoctorProfile.availability JSON into doctor_availability.
+
+    Doctors that already have availability rows are skipped, so this is safe
+    to run on every startup.
+    """
+    migrated = db.select(DoctorAvailability.doctor_id).distinct()
+    profiles = DoctorProfile.query.filter(
+        DoctorProfile.user_id.isnot(None),
+        DoctorProfile.availability.isnot(None),
+        DoctorProfile.user_id.notin_(migrated),
+    ).all()
+    for profile in profiles:
+        sync_profile_availability(profile.user_id, profile.availability)
+    if profiles:
+        db.session.commit()
+
+
+def bump_availability_version(doctor_id, slot_changes=()):
+    """Mark a doctor's free slots as changed; runs in the caller's transaction.
+
+    slot_changes lists the (date, time, booked) flips made by the same
+    transaction; they are written through to SLOT_OCCUPANCY once it commits.
+    """
+    _increment(AvailabilityVersion.__table__, {"doctor_id": doctor_id}, "version", 1)
+    version = db.session.scalar(
+        db.select(AvailabilityVersion.version).where(AvailabilityVersion.doctor_id == doctor_id)
+    )
+    db.session.info.setdefault("slot_writes", []).append((doctor_id, version, tuple(slot_changes)))
+
+
+def availability_version(doctor_id):
+    row = db.session.get(AvailabilityVersion, doctor_id)
+    return row.version if row else 0
+
+
+def availability_versions(doctor_ids):
+    return dict(
+        db.session.query(AvailabilityVersion.doctor_id, AvailabilityVersion.version)
+        .filter(AvailabilityVersion.doctor_id.in_(doctor_ids))
+        .all()
+    )
+
+
+# ---------------------------
+# Slot occupancy cache: booked-slot bitmap per (doctor, date)
+# ---------------------------
+class SlotOccupancy:
+    """Bounded LRU of booked-slot bitmaps keyed by (doctor_id, date).
+
+    A doctor's entries are served only while their availability version is
+    the one this process last saw. Commits made here are written through
+    (the doctor moves to the new version with the flipped bits applied);
+    a version moved by any other process starts a new generation, which
+    drops all of that doctor's entries at once, and days are reloaded lazily.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.days = TTLCache(maxsize, ttl)  # (doctor_id, date) -> (generation, bitmap)
+        self.doctors = TTLCache(maxsize, ttl)  # doctor_id -> (version, generation)
+        self._generations = count(1)
+        self._lock = threading.Lock()
+
+    def lookup(self, doctor_id, version, dates):
+        """({date: bitmap} for the cached dates, generation to store the others under)."""
+        with self._lock:
+            seen = self.doctors.get(doctor_id)
+            if seen is None or seen[0] != version:
+                seen = (version, next(self._generations))
+                self.doctors.set(doctor_id, seen)
+            found = {}
+            for day in dates:
+                entry = self.days.get((doctor_id, day))
+                if entry is not None and entry[0] == seen[1]:
+                    found[day] = entry[1]
+        return found, seen[1]
+
+    def store(self, doctor_id, version, generation, bitmaps):
+        """Cache bitmaps loaded at `version`, unless the doctor has moved on meanwhile."""
+        with self._lock:
+            if self.doctors.get(doctor_id) != (version, generation):
+                return
+            for day, bitmap in bitmaps.items():
+                self.days.set((doctor_id, day), (generation, bitmap))
+
+    def write_through(self, doctor_id, version, slot_changes):
+        """Apply a committed change that moved the doctor to `version`."""
+        with self._lock:
+            seen = self.doctors.get(doctor_id)
+            if seen is None or seen[0] != version - 1:
+                # another process changed this doctor too; reload on next read
+                self.doctors.pop(doctor_id)
+                return
+            generation = seen[1]
+            for day, slot_time, booked in slot_changes:
+                entry = self.days.get((doctor_id, day))
+                if entry is not None and entry[0] == generation:
+                    bit = slot_bit(slot_time)
+                    bitmap = entry[1] | bit if booked else entry[1] & ~bit
+                    self.days.set((doctor_id, day), (generation, bitmap))
+            self.doctors.set(doctor_id, (version, generation))
+
+    def entries(self):
+        """{(doctor_id, date): (version, bitmap)} for every entry that could be served."""
+        with self._lock:
+            doctors = dict(self.doctors.items())
+            return {
+                (doctor_id, day): (doctors[doctor_id][0], bitmap)
+                for (doctor_id, day), (generation, bitmap) in self.days.items()
+                if doctor_id in doctors and doctors[doctor_id][1] == generation
+            }
+
+    def clear(self):
+        with self._lock:
+            self.days.clear()
+            self.doctors.clear()
+
+
+SLOT_OCCUPANCY = SlotOccupancy(maxsize=50000, ttl=3600)
+
+
+@event.listens_for(db.session, "after_commit")
+def _apply_slot_writes(session):
+    for doctor_id, version, slot_changes in session.info.pop("slot_writes", ()):
+        SLOT_OCCUPANCY.write_through(doctor_id, version, slot_changes)
+        SLOT_EVENTS.publish(doctor_id, version, slot_changes)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_slot_writes(session):
+    session.info.pop("slot_writes", None)
+
+
+# ---------------------------
+# Slot change events for live booking pages (Server-Sent Events)
+# ---------------------------
+SLOT_EVENT_CHANNEL = "hms:slot-events"
+SLOT_EVENT_HEARTBEAT_SECONDS = 15
+SLOT_EVENT_BACKLOG = 100  # per stream; a stream that falls further behind is told to resync
+
+
+class SlotSubscriber:
+    """One open event stream: the doctors it follows and its undelivered events."""
+
+    def __init__(self, doctor_ids):
+        self.doctor_ids = frozenset(doctor_ids)
+        self.events = deque()
+        self.overflowed = False
+        self.ready = threading.Event()
+
+    def push(self, name, data):
+        if len(self.events) >= SLOT_EVENT_BACKLOG:
+            self.events.clear()
+            self.overflowed = True
+        self.events.append((name, data))
+        self.ready.set()
+
+    def wait(self, timeout):
+        """Pending (event, data) pairs, or [] if nothing arrived within timeout."""
+        self.ready.wait(timeout)
+        self.ready.clear()
+        if self.overflowed:
+            self.overflowed = False
+            self.events.clear()
+            return [("resync", "{}")]
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+
+class SlotEventBroker:
+    """Fans committed slot changes out to the SSE streams open in this process.
+
+    Streams hold no thread of their own while idle: they wait on an Event,
+    so under a gevent worker (see gunicorn.conf.py) each one is a parked greenlet. With
+    SLOT_EVENTS_REDIS_URL set, events go through Redis pub/sub and one
+    listener thread per process delivers them, so a booking made on any
+    worker reaches every stream; otherwise they stay in-process.
+    """
+
+    def __init__(self):
+        self._subscribers = {}  # doctor_id -> set of SlotSubscriber
+        self._lock = threading.Lock()
+        self._redis = None
+        self._listener = None
+        self._logger = None
+
+    def init_app(self, app):
+        self._logger = app.logger
+        url = app.config.get("SLOT_EVENTS_REDIS_URL")
+        if url and redis is None:
+            raise RuntimeError("SLOT_EVENTS_REDIS_URL is set but the redis package is not installed")
+        # publishing runs right after a commit, so never wait long on an unreachable Redis
+        self._redis = redis.Redis.from_url(url, socket_connect_timeout=2) if url else None
+
+    def subscribe(self, doctor_ids):
+        subscriber = SlotSubscriber(doctor_ids)
+        with self._lock:
+            for doctor_id in subscriber.doctor_ids:
+                self._subscribers.setdefault(doctor_id, set()).add(subscriber)
+            if self._redis is not None and self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="slot-events", daemon=True)
+                self._listener.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for doctor_id in subscriber.doctor_ids:
+                followers = self._subscribers.get(doctor_id)
+                if followers is not None:
+                    followers.discard(subscriber)
+                    if not followers:
+                        del self._subscribers[doctor_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(set().union(*self._subscribers.values())) if self._subscribers else 0
+
+    def publish(self, doctor_id, version, slot_changes):
+        """Announce a committed change; with no slot_changes, clients refetch the doctor."""
+        events = [
+            {
+                "event": "booked" if booked else "freed",
+                "doctor_id": doctor_id,
+                "date": day.isoformat(),
+                "time": slot_time.strftime(LABEL_FORMAT),
+                "version": version,
+            }
+            for day, slot_time, booked in slot_changes
+        ] or [{"event": "changed", "doctor_id": doctor_id, "version": version}]
+        if self._redis is not None:
+            try:
+                for item in events:
+                    self._redis.publish(SLOT_EVENT_CHANNEL, json.dumps(item))
+                return
+            except redis.RedisError as err:
+                self._logger.warning("Could not publish slot events through Redis: %s", err)
+        for item in events:
+            self.deliver(item)
+
+    def deliver(self, item):
+        with self._lock:
+            followers = list(self._subscribers.get(item["doctor_id"], ()))
+        if not followers:
+            return
+        data = json.dumps(item)
+        for subscriber in followers:
+            subscriber.push(item["event"], data)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(SLOT_EVENT_CHANNEL)
+                for message in pubsub.listen():
+                    self.deliver(json.loads(message["data"]))
+            except redis.RedisError as err:
+                self._logger.warning("Slot event listener lost Redis, retrying: %s", err)
+                time.sleep(5)
+
+
+SLOT_EVENTS = SlotEventBroker()
+
+
+def slot_event_stream(doctor_ids):
+    """text/event-stream response with booked / freed / changed events for doctor_ids."""
+    subscriber = SLOT_EVENTS.subscribe(doctor_ids)
+
+    def stream():
+        try:
+            yield f"retry: {SLOT_EVENT_HEARTBEAT_SECONDS * 1000}\n\n"
+            while True:
+                events = subscriber.wait(SLOT_EVENT_HEARTBEAT_SECONDS)
+                if not events:
+                    yield ": ping\n\n"  # keeps proxies from timing out, and finds closed clients
+                for name, data in events:
+                    yield f"event: {name}\ndata: {data}\n\n"
+        finally:
+            SLOT_EVENTS.unsubscribe(subscriber)
+
+    return current_app.response_class(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def stream_token_serializer():
+    return URLSafeTimedSerializer(current_app.config["JWT_SECRET_KEY"], salt="slot-events")
+
+
+def stream_token_required(view):
+    """Accept a ?token= from /slot-events/token instead of the access token.
+
+    EventSource cannot send headers, so the credential has to travel in the
+    URL, where proxies and access logs keep it. A stream token only opens
+    slot event streams and expires after SLOT_EVENTS_TOKEN_SECONDS.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            user_id = stream_token_serializer().loads(
+                request.args.get("token", ""), max_age=current_app.config["SLOT_EVENTS_TOKEN_SECONDS"]
+            )
+        except BadSignature:  # also raised when the token has expired
+            return jsonify({"message": "Invalid or expired stream token"}), 401
+        if account_token_revoked(None, {"user_id": user_id}):
+            return account_token_revoked_response(None, None)
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def load_booked_bitmaps(days):
+    """{doctor_id: {date: bitmap}} from the appointments table for {doctor_id: [dates]}, in one query."""
+    bitmaps = {doctor_id: dict.fromkeys(dates, 0) for doctor_id, dates in days.items()}
+    all_dates = [day for dates in days.values() for day in dates]
+    if not all_dates:
+        return bitmaps
+    rows = (
+        db.session.query(Appointment.doctor_id, Appointment.date, Appointment.time)
+        .filter(
+            Appointment.doctor_id.in_(list(days)),
+            Appointment.status == "Booked",
+            Appointment.date >= min(all_dates),
+            Appointment.date <= max(all_dates),
+        )
+        .all()
+    )
+    for doctor_id, appt_date, appt_time in rows:
+        doctor_days = bitmaps[doctor_id]
+        if appt_date in doctor_days:
+            doctor_days[appt_date] |= slot_bit(appt_time)
+    return bitmaps
+
+
+def occupied_slots(versions, days):
+    """{doctor_id: {date: booked-slot bitmap}} for {doctor_id: [dates]}.
+
+    versions holds each doctor's availability version as read by the caller.
+    Cached days come from SLOT_OCCUPANCY; the rest are loaded in one query.
+    """
+    result = {}
+    missing = {}
+    generations = {}
+    for doctor_id, dates in days.items():
+        found, generations[doctor_id] = SLOT_OCCUPANCY.lookup(doctor_id, versions.get(doctor_id, 0), dates)
+        result[doctor_id] = found
+        rest = [day for day in dates if day not in found]
+        if rest:
+            missing[doctor_id] = rest
+    misses = sum(len(dates) for dates in missing.values())
+    record_metric("slot_occupancy_hits", sum(len(dates) for dates in days.values()) - misses)
+    record_metric("slot_occupancy_misses", misses)
+
+    for doctor_id, bitmaps in load_booked_bitmaps(missing).items():
+        SLOT_OCCUPANCY.store(doctor_id, versions.get(doctor_id, 0), generations[doctor_id], bitmaps)
+        result[doctor_id].update(bitmaps)
+    return result
+
+
+def verify_slot_occupancy():
+    """Compare every servable SLOT_OCCUPANCY entry with the database.
+
+    Returns (entries checked, mismatches). Entries whose doctor has a newer
+    version in the database are skipped: they would be reloaded, not served.
+    """
+    entries = SLOT_OCCUPANCY.entries()
+    versions = availability_versions({doctor_id for doctor_id, _ in entries})
+    current = {
+        key: bitmap
+        for key, (version, bitmap) in entries.items()
+        if versions.get(key[0], 0) == version
+    }
+    days = {}
+    for doctor_id, day in current:
+        days.setdefault(doctor_id, []).append(day)
+    actual = load_booked_bitmaps(days)
+    mismatches = [
+        {
+            "doctor_id": doctor_id,
+            "date": day.isoformat(),
+            "cached": [t.strftime("%H:%M") for t in bitmap_times(bitmap)],
+            "database": [t.strftime("%H:%M") for t in bitmap_times(actual[doctor_id][day])],
+        }
+        for (doctor_id, day), bitmap in sorted(current.items())
+        if actual[doctor_id][day] != bitmap
+    ]
+    return len(current), mismatches
+
+
+# ---------------------------
+# Free-slot index for "next available" searches
+# ---------------------------
+NEXT_AVAILABLE_HORIZON_DAYS = 60
+NEXT_AVAILABLE_LIMIT_MAX = 100
+
+# doctor id -> (availability version, day built, sorted free slot datetimes)
+FREE_SLOT_INDEX = TTLCache(maxsize=5000, ttl=600)
+
+
+def free_slot_index(doctor_ids, department_id):
+    """{doctor_id: sorted free slot datetimes} for today + NEXT_AVAILABLE_HORIZON_DAYS.
+
+    Entries are checked against availability_versions in one query, so a
+    booking, cancellation or edit made by any process is seen on the next
+    call; only doctors whose version moved are rebuilt, in one batch.
+    """
+    today = DateTime.now().date()
+    versions = availability_versions(doctor_ids)
+    index = {}
+    stale = []
+    for doctor_id in doctor_ids:
+        entry = FREE_SLOT_INDEX.get(doctor_id)
+        if entry is not None and entry[0] == versions.get(doctor_id, 0) and entry[1] == today:
+            index[doctor_id] = entry[2]
+        else:
+            stale.append(doctor_id)
+    if not stale:
+        return index
+
+    horizon = today + timedelta(days=NEXT_AVAILABLE_HORIZON_DAYS)
+    days = (
+        available_days_query(today, horizon)
+        .filter(DoctorAvailability.doctor_id.in_(stale))
+        .order_by(DoctorAvailability.doctor_id, DoctorAvailability.date)
+        .all()
+    )
+    dates = {doctor_id: [] for doctor_id in stale}
+    for day in days:
+        dates[day.doctor_id].append(day.date)
+    occupied = occupied_slots(versions, dates)
+    schedules = schedules_for((doctor_id, department_id) for doctor_id in stale)
+    slots = {doctor_id: [] for doctor_id in stale}
+    for day in days:
+        grid = day_grid(schedules[day.doctor_id], day)
+        bitmap = occupied[day.doctor_id][day.date]
+        slots[day.doctor_id].extend(
+            DateTime.combine(day.date, slot_time)
+            for slot_time, bit in zip(grid.times, grid.bits)
+            if not bitmap & bit
+        )
+    for doctor_id in stale:
+        FREE_SLOT_INDEX.set(doctor_id, (versions.get(doctor_id, 0), today, slots[doctor_id]))
+        index[doctor_id] = slots[doctor_id]
+    return index
+
+
+def next_free_slots(index, after, limit):
+    """First `limit` (datetime, doctor_id) pairs at or after `after`, across every doctor in index."""
+    streams = [
+        zip(islice(slots, bisect_left(slots, after), None), repeat(doctor_id))
+        for doctor_id, slots in index.items()
+    ]
+    return list(islice(heapq.merge(*streams), limit))
+
+
 # ---------------------------
 # Home
 # ---------------------------
-@app.route("/")
+@bp.route("/")
 def index():
     return render_template("index.html")
 
@@ -156,7 +1533,7 @@ def index():
 # AUTH: register / login
 # - NOTE: only patients self-register. Doctors are created by admin.
 # ---------------------------
-@app.route("/register", methods=["POST"])
+@bp.route("/register", methods=["POST"])
 def register():
     data = request.get_json() or {}
     username = data.get("username")
@@ -178,15 +1555,16 @@ def register():
     if User.query.filter_by(username=username).first():
         return jsonify({"category": "danger", "message": "User already exists"}), 400
 
-    hashed = generate_password_hash(password)
+    hashed = hash_password(password)
     # patients auto-approved
     user = User(username=username, password=hashed, role="patient", approve=True, blocked=False)
     db.session.add(user)
+    count_user("patient")
     db.session.commit()
     return jsonify({"category": "success", "message": "registered"}), 200
 
 
-@app.route("/login", methods=["POST"])
+@bp.route("/login", methods=["POST"])
 def login():
     data = request.get_json() or {}
     username = data.get("username")
@@ -195,7 +1573,7 @@ def login():
         return jsonify({"category": "danger", "message": "username & password required"}), 400
 
     user = User.query.filter_by(username=username).first()
-    if not user or not check_password_hash(user.password, password):
+    if not user or not verify_password(user, password):
         return jsonify({"category": "danger", "message": "Bad username or password"}), 401
 
     if user.blocked:
@@ -229,7 +1607,7 @@ def login():
     return jsonify({"access_token": token}), 200
 
 
-@app.route("/get-claims", methods=["GET"])
+@bp.route("/get-claims", methods=["GET"])
 @jwt_required()
 def get_claims():
     claims = get_jwt()
@@ -239,7 +1617,7 @@ def get_claims():
 # ---------------------------
 # ADMIN endpoints
 # ---------------------------
-@app.route("/admin/login", methods=["POST"])
+@bp.route("/admin/login", methods=["POST"])
 def admin_login():
     data = request.get_json() or {}
     username = data.get("username")
@@ -248,29 +1626,92 @@ def admin_login():
         return jsonify({"category": "danger", "message": "username & password required"}), 400
 
     user = User.query.filter_by(username=username, role="admin").first()
-    if not user or not check_password_hash(user.password, password):
+    if not user or not verify_password(user, password):
         return jsonify({"category": "danger", "message": "Bad username or password"}), 401
     token = create_access_token(identity=user.username, additional_claims={"admin_user_id": user.id, "role": "admin"})
     return jsonify({"access_token": token}), 200
 
 
-@app.route("/admin/dashboard", methods=["GET"])
+@bp.route("/admin/metrics", methods=["GET"])
+@jwt_required()
+def admin_metrics():
+    claims = get_jwt()
+    if not is_admin_claims(claims):
+        return jsonify({"message": "Admin only"}), 401
+    with _metrics_lock:
+        metrics = dict(METRICS)
+    checks = metrics["password_checks"]
+    metrics["password_check_cpu_ms_avg"] = (
+        round(metrics["password_check_cpu_seconds"] * 1000 / checks, 3) if checks else None
+    )
+    metrics["password_hash_method"] = current_app.config["PASSWORD_HASH_METHOD"]
+    lookups = metrics["slot_occupancy_hits"] + metrics["slot_occupancy_misses"]
+    metrics["slot_occupancy_hit_rate"] = (
+        round(metrics["slot_occupancy_hits"] / lookups, 3) if lookups else None
+    )
+    metrics["slot_event_subscribers"] = SLOT_EVENTS.subscriber_count()
+    return jsonify(metrics), 200
+
+
+@bp.route("/admin/slot-cache/verify", methods=["GET"])
+@use_primary
+@jwt_required()
+def admin_verify_slot_cache():
+    """Check this worker's slot occupancy cache against the appointments table."""
+    claims = get_jwt()
+    if not is_admin_claims(claims):
+        return jsonify({"message": "Admin only"}), 401
+    checked, mismatches = verify_slot_occupancy()
+    return jsonify({"checked": checked, "mismatches": mismatches}), 200
+
+
+@bp.route("/admin/dashboard", methods=["GET"])
 @jwt_required()
 def admin_dashboard():
     claims = get_jwt()
     if not is_admin_claims(claims):
         return jsonify({"message": "Admin only"}), 401
 
-    total_doctors = User.query.filter_by(role="doctor").count()
-    total_patients = User.query.filter_by(role="patient").count()
-    total_appointments = Appointment.query.count()
-    upcoming = Appointment.query.filter(Appointment.date >= DateTime.now().date()).count()
+    # served from the counter tables, so cost does not grow with the appointments table
+    users = dict(db.session.query(StatCounter.name, StatCounter.value).all())
+    is_upcoming = case((AppointmentDailyStat.date >= DateTime.now().date(), 1), else_=0)
+    rows = (
+        db.session.query(
+            AppointmentDailyStat.status,
+            AppointmentDailyStat.department_id,
+            is_upcoming,
+            func.sum(AppointmentDailyStat.count),
+        )
+        .group_by(AppointmentDailyStat.status, AppointmentDailyStat.department_id, is_upcoming)
+        .all()
+    )
+
+    total_appointments = upcoming = 0
+    by_status = {}
+    by_department = {}
+    for status, department_id, upcoming_flag, count in rows:
+        total_appointments += count
+        if upcoming_flag:
+            upcoming += count
+        by_status[status] = by_status.get(status, 0) + count
+        by_department[department_id] = by_department.get(department_id, 0) + count
+
+    department_names = {d["id"]: d["name"] for d in cached_departments()[0]}
     return jsonify(
         {
-            "total_doctors": total_doctors,
-            "total_patients": total_patients,
+            "total_doctors": users.get("users:doctor", 0),
+            "total_patients": users.get("users:patient", 0),
             "total_appointments": total_appointments,
             "upcoming_appointments": upcoming,
+            "appointments_by_status": by_status,
+            "appointments_by_department": [
+                {
+                    "department_id": department_id or None,
+                    "department_name": department_names.get(department_id),
+                    "count": count,
+                }
+                for department_id, count in sorted(by_department.items())
+            ],
         }
     ), 200
 
@@ -278,7 +1719,8 @@ def admin_dashboard():
 # ----------------------------
 # Admin: List or Create Doctors
 # ----------------------------
-@app.route("/admin/doctors", methods=["GET", "POST"])
+@bp.route("/admin/doctors", methods=["GET", "POST"])
+@use_primary
 @jwt_required()
 def admin_doctors():
     claims = get_jwt()
@@ -286,19 +1728,38 @@ def admin_doctors():
         return jsonify({"message": "Admin only"}), 401
 
     if request.method == "GET":
-        doctors = User.query.filter_by(role="doctor").all()
+        # one query for doctors + profile + department, with optional filters
+        # ?approve=true|false&blocked=true|false&specialization=<dept_id>
+        try:
+            approve = parse_bool_arg("approve")
+            blocked = parse_bool_arg("blocked")
+            specialization = parse_int_arg("specialization")
+        except ValueError:
+            return jsonify({"message": "approve/blocked must be true or false and specialization a department id"}), 400
+
+        query = (
+            db.session.query(User, DoctorProfile, Department)
+            .outerjoin(DoctorProfile, DoctorProfile.user_id == User.id)
+            .outerjoin(Department, Department.id == DoctorProfile.specialization_id)
+            .filter(User.role == "doctor")
+        )
+        if approve is not None:
+            query = query.filter(User.approve == approve)
+        if blocked is not None:
+            query = query.filter(User.blocked == blocked)
+        if specialization is not None:
+            query = query.filter(DoctorProfile.specialization_id == specialization)
+
         data = []
-        for d in doctors:
-            profile = DoctorProfile.query.filter_by(user_id=d.id).first()
+        for d, profile, dept in query.order_by(User.id).all():
             data.append({
                 "id": d.id,
                 "username": d.username,
                 "approve": d.approve,
                 "blocked": d.blocked,
                 "specialization_id": profile.specialization_id if profile else None,
-                "specialization_name": Department.query.get(profile.specialization_id).name if profile and profile.specialization_id else None,
+                "specialization_name": dept.name if dept else None,
                 "experience": profile.experience if profile else None,
-                "availability": profile.availability if profile else None
             })
         return jsonify(data), 200
 
@@ -319,18 +1780,22 @@ def admin_doctors():
     if User.query.filter_by(username=username).first():
         return jsonify({"message": "Username already exists"}), 400
 
-    user = User(username=username, password=generate_password_hash(password), role="doctor", approve=data.get("approve", False), blocked=False)
+    user = User(username=username, password=hash_password(password), role="doctor", approve=data.get("approve", False), blocked=False)
     db.session.add(user)
+    count_user("doctor")
     db.session.commit()
 
-    profile = DoctorProfile(user_id=user.id, specialization_id=specialization_id, experience=experience, availability=availability)
+    profile = DoctorProfile(user_id=user.id, specialization_id=specialization_id, experience=experience)
     db.session.add(profile)
+    sync_profile_availability(user.id, availability)
     db.session.commit()
+    invalidate_catalog()
 
     return jsonify({"message": "Doctor created successfully"}), 201
 
 
-@app.route("/admin/doctors/<int:user_id>", methods=["GET", "PUT", "DELETE"])
+@bp.route("/admin/doctors/<int:user_id>", methods=["GET", "PUT", "DELETE"])
+@use_primary
 @jwt_required()
 def admin_doctor_detail(user_id):
     claims = get_jwt()
@@ -343,13 +1808,16 @@ def admin_doctor_detail(user_id):
 
     if request.method == "GET":
         profile = DoctorProfile.query.filter_by(user_id=user.id).first()
-        return jsonify({"id": user.id, "username": user.username, "approve": user.approve, "blocked": user.blocked, "profile": profile.as_dict() if profile else None}), 200
+        profile_json = dict(profile.as_dict(), availability=availability_json(user.id)) if profile else None
+        return jsonify({"id": user.id, "username": user.username, "approve": user.approve, "blocked": user.blocked, "profile": profile_json}), 200
 
     if request.method == "PUT":
         data = request.get_json() or {}
         user.approve = data.get("approve", user.approve)
         user.blocked = data.get("blocked", user.blocked)
         db.session.commit()
+        invalidate_account(user.id)
+        invalidate_catalog()
         return jsonify({"message": "updated"}), 200
 
     if request.method == "DELETE":
@@ -357,12 +1825,97 @@ def admin_doctor_detail(user_id):
         if prof:
             db.session.delete(prof)
         db.session.delete(user)
+        count_user("doctor", -1)
         db.session.commit()
+        invalidate_account(user_id)
+        invalidate_catalog()
         return jsonify({"message": "deleted"}), 200
 
 
+def update_working_hours(row, data):
+    """Apply day_start/day_end ("HH:MM"), slot_minutes and breaks from a request body.
+
+    Fields set to null fall back to the department / default values; breaks
+    "" means no breaks at all. Raises ValueError.
+    """
+    for field in ("day_start", "day_end"):
+        if field in data:
+            setattr(row, field, DateTime.strptime(data[field], "%H:%M").time() if data[field] else None)
+    if "slot_minutes" in data:
+        minutes = data["slot_minutes"]
+        if minutes is not None and (type(minutes) is not int or not 5 <= minutes <= 240):
+            raise ValueError("slot_minutes must be a whole number between 5 and 240")
+        row.slot_minutes = minutes
+    if "breaks" in data:
+        row.breaks = None if data["breaks"] is None else format_breaks(parse_breaks(data["breaks"]))
+    if row.day_start and row.day_end and row.day_start >= row.day_end:
+        raise ValueError("day_start must be before day_end")
+
+
+@bp.route("/admin/doctors/<int:user_id>/working-hours", methods=["GET", "PUT"])
+@use_primary
+@jwt_required()
+def admin_doctor_working_hours(user_id):
+    claims = get_jwt()
+    if not is_admin_claims(claims):
+        return jsonify({"message": "Admin only"}), 401
+    user = User.query.get_or_404(user_id)
+    if user.role != "doctor":
+        return jsonify({"message": "User is not a doctor"}), 400
+
+    row = WorkingHours.query.filter_by(doctor_id=user_id).first()
+    if request.method == "PUT":
+        if row is None:
+            row = WorkingHours(doctor_id=user_id)
+            db.session.add(row)
+        try:
+            update_working_hours(row, request.get_json() or {})
+        except (ValueError, TypeError, AttributeError) as e:
+            db.session.rollback()
+            return jsonify({"message": f"Invalid working hours: {e}"}), 400
+        bump_availability_version(user_id)
+        db.session.commit()
+
+    return jsonify({
+        "working_hours": row.as_dict() if row else None,
+        "effective": schedule_as_dict(schedule_for(user_id)),
+    }), 200
+
+
+@bp.route("/admin/departments/<int:dept_id>/working-hours", methods=["GET", "PUT"])
+@use_primary
+@jwt_required()
+def admin_department_working_hours(dept_id):
+    claims = get_jwt()
+    if not is_admin_claims(claims):
+        return jsonify({"message": "Admin only"}), 401
+    Department.query.get_or_404(dept_id)
+
+    row = WorkingHours.query.filter_by(department_id=dept_id).first()
+    if request.method == "PUT":
+        if row is None:
+            row = WorkingHours(department_id=dept_id)
+            db.session.add(row)
+        try:
+            update_working_hours(row, request.get_json() or {})
+        except (ValueError, TypeError, AttributeError) as e:
+            db.session.rollback()
+            return jsonify({"message": f"Invalid working hours: {e}"}), 400
+        doctor_ids = db.session.query(DoctorProfile.user_id).filter(
+            DoctorProfile.specialization_id == dept_id, DoctorProfile.user_id.isnot(None)
+        )
+        for (doctor_id,) in doctor_ids:
+            bump_availability_version(doctor_id)
+        db.session.commit()
+
+    return jsonify({
+        "working_hours": row.as_dict() if row else None,
+        "effective": schedule_as_dict(schedules_for([(None, dept_id)])[None]),
+    }), 200
+
+
 # Admin: create or update doctor profile
-@app.route("/admin/doctors/<int:user_id>/profile", methods=["POST"])
+@bp.route("/admin/doctors/<int:user_id>/profile", methods=["POST"])
 @jwt_required()
 def admin_doctor_profile(user_id):
     claims = get_jwt()
@@ -380,24 +1933,26 @@ def admin_doctor_profile(user_id):
 
     # Find or create profile
     profile = DoctorProfile.query.filter_by(user_id=user_id).first()
+    previous = profile.availability if profile else None
     if profile:
         profile.specialization_id = specialization_id or profile.specialization_id
         profile.experience = experience or profile.experience
-        profile.availability = availability or profile.availability
     else:
         profile = DoctorProfile(
             user_id=user_id,
             specialization_id=specialization_id,
             experience=experience,
-            availability=availability
         )
         db.session.add(profile)
 
+    sync_profile_availability(user_id, availability, previous)
     db.session.commit()
+    invalidate_catalog()
     return jsonify({"message": "Doctor profile saved successfully"}), 200
 
 
-@app.route("/admin/patients", methods=["GET"])
+@bp.route("/admin/patients", methods=["GET"])
+@use_primary
 @jwt_required()
 def admin_patients():
     claims = get_jwt()
@@ -407,20 +1962,23 @@ def admin_patients():
     return jsonify([{"id": p.id, "username": p.username} for p in patients]), 200
 
 
-@app.route("/admin/appointments", methods=["GET"])
+@bp.route("/admin/appointments", methods=["GET"])
 @jwt_required()
 def admin_appointments():
     claims = get_jwt()
     if not is_admin_claims(claims):
         return jsonify({"message": "Admin only"}), 401
-    appts = Appointment.query.order_by(Appointment.date.desc(), Appointment.time.desc()).all()
+    try:
+        appts, next_cursor = paginate_appointments(Appointment.query, descending=True)
+    except ValueError:
+        return jsonify({"message": "Invalid cursor, date filter or limit"}), 400
     result = []
     for a in appts:
-        result.append({"id": a.id, "patient_id": a.patient_id, "doctor_id": a.doctor_id, "date": str(a.date), "time": str(a.time), "status": a.status, "remarks": a.remarks})
-    return jsonify(result), 200
+        result.append({"id": a.id, "patient_id": a.patient_id, "doctor_id": a.doctor_id, "date": a.date, "time": a.time, "status": a.status, "remarks": a.remarks})
+    return jsonify({"appointments": result, "next_cursor": next_cursor}), 200
 
 
-@app.route("/admin/block_user/<int:user_id>", methods=["POST"])
+@bp.route("/admin/block_user/<int:user_id>", methods=["POST"])
 @jwt_required()
 def admin_block_user(user_id):
     claims = get_jwt()
@@ -440,11 +1998,14 @@ def admin_block_user(user_id):
     else:
         return jsonify({"message": "invalid action"}), 400
     db.session.commit()
+    invalidate_account(user.id)
+    if user.role == "doctor":
+        invalidate_catalog()
     return jsonify({"message": "done"}), 200
 
 
 # Admin: trigger CSV export of appointments for a doctor
-@app.route("/admin/export/<int:professional_id>", methods=["GET"])
+@bp.route("/admin/export/<int:professional_id>", methods=["GET"])
 @jwt_required()
 def export_service_requests(professional_id):
     claims = get_jwt()
@@ -454,7 +2015,7 @@ def export_service_requests(professional_id):
     return jsonify({"message": f"Export started for professional ID {professional_id}.", "task_id": task.id}), 202
 
 
-@app.route("/admin/reports/list", methods=["GET"])
+@bp.route("/admin/reports/list", methods=["GET"])
 @jwt_required()
 def list_reports():
     claims = get_jwt()
@@ -465,7 +2026,7 @@ def list_reports():
     return jsonify({"downloads": files}), 200
 
 
-@app.route("/admin/reports/download/<filename>", methods=["GET"])
+@bp.route("/admin/reports/download/<filename>", methods=["GET"])
 @jwt_required()
 def download_report(filename):
     claims = get_jwt()
@@ -477,7 +2038,8 @@ def download_report(filename):
 # ---------------------------
 # DOCTOR endpoints
 # ---------------------------
-@app.route("/doctor/profile", methods=["GET", "POST"])
+@bp.route("/doctor/profile", methods=["GET", "POST"])
+@use_primary
 @jwt_required()
 def doctor_profile():
     claims = get_jwt()
@@ -494,7 +2056,7 @@ def doctor_profile():
             "username": profile.user.username,
             "specialization_id": profile.specialization_id,
             "experience": profile.experience,
-            "availability": profile.availability  # stored as JSON string
+            "availability": availability_json(doctor_id),  # JSON string, from doctor_availability
         }), 200
 
     # -------- POST --------
@@ -503,23 +2065,24 @@ def doctor_profile():
     experience = data.get("experience")
     availability = data.get("availability")  # JSON string from frontend
 
+    previous = profile.availability if profile else None
     if not profile:
         profile = DoctorProfile(
             user_id=doctor_id,
             specialization_id=specialization_id,
             experience=experience,
-            availability=availability
         )
         db.session.add(profile)
     else:
         profile.specialization_id = specialization_id
         profile.experience = experience
-        profile.availability = availability
 
+    sync_profile_availability(doctor_id, availability, previous)
     db.session.commit()
+    invalidate_catalog()
     return jsonify({"message": "Profile updated successfully"}), 200
 
-# @app.route("/doctor/availability", methods=["GET", "POST"])
+# @bp.route("/doctor/availability", methods=["GET", "POST"])
 # @jwt_required()
 # def doctor_availability():
 #     claims = get_jwt()
@@ -539,21 +2102,28 @@ def doctor_profile():
 #     return jsonify({"message": "Availability updated successfully"}), 200
 
 
-@app.route("/doctor/appointments", methods=["GET"])
+@bp.route("/doctor/appointments", methods=["GET"])
+@use_primary
 @jwt_required()
 def doctor_appointments():
     claims = get_jwt()
     if not is_doctor_claims(claims):
         return jsonify({"message": "Doctor only"}), 401
     doctor_id = claims["user_id"]
-    appts = Appointment.query.filter_by(doctor_id=doctor_id).order_by(Appointment.date.asc(), Appointment.time.asc()).all()
+    try:
+        # open past visits, then today's and upcoming ones; ?from= reaches back into history
+        appts, next_cursor = paginate_appointments(
+            Appointment.query.filter_by(doctor_id=doctor_id), default_from=DateTime.now().date()
+        )
+    except ValueError:
+        return jsonify({"message": "Invalid cursor, date filter or limit"}), 400
     result = []
     for a in appts:
-        result.append({"id": a.id, "patient_id": a.patient_id, "date": str(a.date), "time": str(a.time), "status": a.status, "remarks": a.remarks})
-    return jsonify(result), 200
+        result.append({"id": a.id, "patient_id": a.patient_id, "date": a.date, "time": a.time, "status": a.status, "remarks": a.remarks})
+    return jsonify({"appointments": result, "next_cursor": next_cursor}), 200
 
 
-@app.route("/doctor/appointments/<int:appointment_id>/complete", methods=["POST"])
+@bp.route("/doctor/appointments/<int:appointment_id>/complete", methods=["POST"])
 @jwt_required()
 def doctor_complete_appointment(appointment_id):
     claims = get_jwt()
@@ -569,26 +2139,35 @@ def doctor_complete_appointment(appointment_id):
     prescription = data.get("prescription", "")
     notes = data.get("notes", "")
 
+    if appt.status != "Completed":
+        count_appointment(appt, appt.status, -1)
+        count_appointment(appt, "Completed")
+        if appt.status == "Booked":
+            bump_availability_version(appt.doctor_id, [(appt.date, appt.time, False)])
     appt.status = "Completed"
-    db.session.commit()
 
     treatment = Treatment(appointment_id=appt.id, diagnosis=diagnosis, prescription=prescription, notes=notes)
     db.session.add(treatment)
+
+    # notify patient by email if patient.username is an email; the outbox row
+    # commits together with the appointment and treatment, and a worker sends it
+    email = None
+    patient_user = db.session.get(User, appt.patient_id)
+    if patient_user and "@" in patient_user.username:
+        email = queue_email(
+            patient_user.username,
+            "Your visit summary",
+            body=f"Your appointment on {appt.date} with doctor id {appt.doctor_id} is completed.\nDiagnosis: {diagnosis}\nPrescription: {prescription}",
+        )
     db.session.commit()
 
-    # optional: notify patient by email if patient.username is an email
-    try:
-        patient_user = User.query.get(appt.patient_id)
-        if patient_user and "@" in patient_user.username:
-            msg = Message(subject="Your visit summary", recipients=[patient_user.username], body=f"Your appointment on {appt.date} with doctor id {appt.doctor_id} is completed.\nDiagnosis: {diagnosis}\nPrescription: {prescription}")
-            mail.send(msg)
-    except Exception:
-        pass
+    if email is not None:
+        dispatch_outbox([email.id])
 
     return jsonify({"message": "Appointment completed and treatment saved"}), 200
 
 # ✅ Get availability
-# @app.route("/doctor/<int:doctor_id>/availability", methods=["GET"])
+# @bp.route("/doctor/<int:doctor_id>/availability", methods=["GET"])
 # @jwt_required()
 # def get_doctor_availability(doctor_id):
 #     profile = DoctorProfile.query.filter_by(user_id=doctor_id).first()
@@ -620,68 +2199,69 @@ def doctor_complete_appointment(appointment_id):
 
 #     return jsonify({"availability": available_days}), 200
 
-@app.route("/doctor/<int:doctor_id>/availability", methods=["GET"])
+@bp.route("/doctor/<int:doctor_id>/availability", methods=["GET"])
+@use_primary
 @jwt_required()
 def get_doctor_availability(doctor_id):
-    profile = DoctorProfile.query.filter_by(user_id=doctor_id).first()
-    
-    if not profile or not profile.availability:
-        return jsonify({"availability": []}), 200
-
-    availability_data = json.loads(profile.availability)
-    available_days = []
-
-    for date_str, available in availability_data.items():
-        if not available:
-            continue
-
-        slots = []
-        start_hour = 11
-        end_hour = 17
-
-        # Convert date string → date object
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-
-        current = datetime.strptime(f"{date_str} {start_hour}:00", "%Y-%m-%d %H:%M")
+    # optional window: ?from=YYYY-MM-DD&to=YYYY-MM-DD (from defaults to today)
+    try:
+        date_from = parse_date_arg("from", DateTime.now().date())
+        date_to = parse_date_arg("to")
+    except ValueError:
+        return jsonify({"message": "Invalid date format, expected YYYY-MM-DD"}), 400
+
+    # the version changes with every booking, cancellation and availability edit,
+    # so a repeat request for the same window is answered without building the body
+    version = availability_version(doctor_id)
+    etag = f"avail-{doctor_id}-{version}-{date_from}-{date_to or ''}"
+
+    def build():
+        available_days = (
+            available_days_query(date_from, date_to)
+            .filter(DoctorAvailability.doctor_id == doctor_id)
+            .order_by(DoctorAvailability.date)
+            .all()
+        )
+        if not available_days:
+            return {"availability": []}
 
-        while current.hour < end_hour:
-            slot_time = current.time()                 # proper time object
-            slot_str = current.strftime("%I:%M %p")    # for display
+        occupied = occupied_slots({doctor_id: version}, {doctor_id: [day.date for day in available_days]})
+        return {"availability": free_slot_days(available_days, occupied[doctor_id], schedule_for(doctor_id))}
 
-            # Check if slot is booked
-            existing = Appointment.query.filter_by(
-                doctor_id=doctor_id,
-                date=date_obj,
-                time=slot_time
-            ).first()
+    return conditional_json(etag, build)
 
-            # skip booked slots
-            if existing and existing.status == "Booked":
-                current += timedelta(minutes=30)
-                continue
 
-            # Add slot only if NOT booked
-            slots.append(slot_str)
-            current += timedelta(minutes=30)
+@bp.route("/slot-events/token", methods=["POST"])
+@jwt_required()
+def slot_events_token():
+    """Short-lived token for opening a slot event stream; see stream_token_required."""
+    token = stream_token_serializer().dumps(token_user_id(get_jwt()))
+    return jsonify({"token": token, "expires_in": current_app.config["SLOT_EVENTS_TOKEN_SECONDS"]}), 200
 
-        available_days.append({
-            "date": date_str,
-            "slots": slots
-        })
 
-    return jsonify({"availability": available_days}), 200
+@bp.route("/doctor/<int:doctor_id>/slot-events", methods=["GET"])
+@stream_token_required
+def doctor_slot_events(doctor_id):
+    return slot_event_stream([doctor_id])
 
 
 # ✅ Get already booked appointments
-@app.route("/doctor/<int:doctor_id>/appointments", methods=["GET"])
+@bp.route("/doctor/<int:doctor_id>/appointments", methods=["GET"])
+@use_primary
 @jwt_required()
 def get_doctor_booked_appointments(doctor_id):
     # get appointments and include doctor / department via relationships if available
-    appts = Appointment.query.filter_by(doctor_id=doctor_id).order_by(Appointment.date.asc(), Appointment.time.asc()).all()
+    query = Appointment.query.filter_by(doctor_id=doctor_id).options(
+        joinedload(Appointment.doctor), joinedload(Appointment.department)
+    )
+    try:
+        appts, next_cursor = paginate_appointments(query, default_from=DateTime.now().date())
+    except ValueError:
+        return jsonify({"message": "Invalid cursor, date filter or limit"}), 400
     booked = [appointment_to_dict(a) for a in appts]
-    return jsonify({"appointments": booked}), 200
+    return jsonify({"appointments": booked, "next_cursor": next_cursor}), 200
 
-@app.route("/appointments/book", methods=["POST"])
+@bp.route("/appointments/book", methods=["POST"])
 @jwt_required()
 def book_appointment():
     claims = get_jwt()
@@ -693,6 +2273,10 @@ def book_appointment():
 
     if not (doctor_id and date_str and time_str):
         return jsonify({"message": "Missing data"}), 400
+    try:
+        doctor_id = parse_id(doctor_id)
+    except ValueError:
+        return jsonify({"message": "doctor_id must be a number"}), 400
 
     # ✅ Convert date string to date object
     try:
@@ -706,31 +2290,206 @@ def book_appointment():
     except ValueError:
         return jsonify({"message": "Invalid time format"}), 400
 
-    # Check for existing appointment
-    existing = Appointment.query.filter_by(
-        doctor_id=doctor_id,
-        date=date_obj,
-        time=time_obj
-    ).first()
-
-    if existing!= None and existing.status=="Booked":
-        return jsonify({"message": "Slot already booked"}), 400
-
+    # Doctor must have published this date and the time must fall in working hours;
+    # the doctor's department comes back in the same query
+    found = (
+        db.session.query(DoctorAvailability, DoctorProfile.specialization_id)
+        .outerjoin(DoctorProfile, DoctorProfile.user_id == DoctorAvailability.doctor_id)
+        .filter(
+            DoctorAvailability.doctor_id == doctor_id,
+            DoctorAvailability.date == date_obj,
+            DoctorAvailability.available == True,
+        )
+        .first()
+    )
+    day, department_id = found if found else (None, None)
+    if not day or not (day.start_time <= time_obj < day.end_time):
+        return jsonify({"message": "Doctor is not available at this time"}), 400
+    schedule = schedules_for([(doctor_id, department_id)])[doctor_id]
+    if time_obj not in day_grid(schedule, day).index:
+        return jsonify({"message": f"{time_str} is not one of the doctor's appointment slots"}), 400
+
+    # No check-then-insert: uq_appointments_booked_slot lets exactly one
+    # concurrent insert for a slot win, every other caller gets a 409
     new_appt = Appointment(
         doctor_id=doctor_id,
         patient_id=patient_id,
+        department_id=department_id,
         date=date_obj,
         time=time_obj,
         status="Booked"
     )
     db.session.add(new_appt)
-    db.session.commit()
+    try:
+        db.session.flush()
+        count_appointment(new_appt, "Booked")
+        bump_availability_version(doctor_id, [(date_obj, time_obj, True)])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": f"Slot {date_str} {time_str} is already booked"}), 409
 
     return jsonify({"message": "Appointment booked successfully!"}), 201
 
 
+BULK_BOOKING_MAX = 52  # a year of weekly visits
+BULK_BOOKING_ATTEMPTS = 3  # best-effort retries when a slot is taken between check and insert
+
+
+def expand_recurrence(rule):
+    """Slots for {"start": "YYYY-MM-DD", "time": "HH:MM AM", "count": N, "every_days": 7}."""
+    start = datetime.strptime(rule["start"], "%Y-%m-%d").date()
+    count = int(rule["count"])
+    every_days = int(rule.get("every_days", 7))
+    if not 1 <= count <= BULK_BOOKING_MAX:
+        raise ValueError(f"count must be between 1 and {BULK_BOOKING_MAX}")
+    if every_days < 1:
+        raise ValueError("every_days must be at least 1")
+    return [
+        {"date": (start + timedelta(days=every_days * i)).isoformat(), "time": rule["time"]}
+        for i in range(count)
+    ]
+
+
+def check_bulk_slots(doctor_id, slots, fresh=False):
+    """Validate (date, time) pairs for one doctor with a fixed number of queries.
+
+    Booked slots come from the occupancy cache, or straight from the
+    database when `fresh` (a retry after losing a race). Returns
+    (department_id, bookable pairs, {pair: reason} for the rest).
+    """
+    found = (
+        db.session.query(DoctorAvailability, DoctorProfile.specialization_id)
+        .outerjoin(DoctorProfile, DoctorProfile.user_id == DoctorAvailability.doctor_id)
+        .filter(
+            DoctorAvailability.doctor_id == doctor_id,
+            DoctorAvailability.date.in_({slot_date for slot_date, _ in slots}),
+            DoctorAvailability.available == True,
+        )
+        .all()
+    )
+    days = {day.date: day for day, _ in found}
+    department_id = found[0][1] if found else None
+    schedule = schedules_for([(doctor_id, department_id)])[doctor_id]
+    if fresh:
+        occupied = load_booked_bitmaps({doctor_id: list(days)})[doctor_id]
+    else:
+        occupied = occupied_slots({doctor_id: availability_version(doctor_id)}, {doctor_id: list(days)})[doctor_id]
+
+    bookable, rejected = [], {}
+    for slot_date, slot_time in slots:
+        day = days.get(slot_date)
+        if not day or not (day.start_time <= slot_time < day.end_time):
+            rejected[(slot_date, slot_time)] = "Doctor is not available at this time"
+        elif slot_time not in day_grid(schedule, day).index:
+            rejected[(slot_date, slot_time)] = "Not one of the doctor's appointment slots"
+        elif occupied[slot_date] & slot_bit(slot_time):
+            rejected[(slot_date, slot_time)] = "Already booked"
+        else:
+            bookable.append((slot_date, slot_time))
+    return department_id, bookable, rejected
+
+
+def slot_json(slot_date, slot_time, **extra):
+    return {"date": slot_date.isoformat(), "time": slot_time.strftime(LABEL_FORMAT), **extra}
+
+
+@bp.route("/appointments/book/bulk", methods=["POST"])
+@jwt_required()
+def book_appointments_bulk():
+    """Book a series of slots with one doctor in one transaction.
+
+    Body: {"doctor_id", "slots": [{"date", "time"}, ...] or
+    "recurrence": {"start", "time", "count", "every_days"},
+    "mode": "all_or_nothing" (default) or "best_effort",
+    "patient_id" (admins booking for a patient)}.
+    """
+    claims = get_jwt()
+    data = request.get_json() or {}
+    if is_admin_claims(claims):
+        try:
+            patient_id = parse_id(data.get("patient_id"))
+        except ValueError:
+            patient_id = None
+        patient = db.session.get(User, patient_id) if patient_id else None
+        if not patient or patient.role != "patient":
+            return jsonify({"message": "patient_id must name a patient"}), 400
+    elif is_patient_claims(claims):
+        patient_id = claims["user_id"]
+    else:
+        return jsonify({"message": "Admin or patient only"}), 401
+
+    try:
+        doctor_id = parse_id(data.get("doctor_id"))
+    except ValueError:
+        doctor_id = None
+    mode = data.get("mode", "all_or_nothing")
+    if not doctor_id or mode not in ("all_or_nothing", "best_effort"):
+        return jsonify({"message": "doctor_id must be a number and mode all_or_nothing or best_effort"}), 400
+    try:
+        requested = expand_recurrence(data["recurrence"]) if data.get("recurrence") else data.get("slots") or []
+        slots = [
+            (
+                datetime.strptime(slot["date"], "%Y-%m-%d").date(),
+                datetime.strptime(slot["time"], LABEL_FORMAT).time(),
+            )
+            for slot in requested
+        ]
+    except (KeyError, TypeError, ValueError) as err:
+        return jsonify({"message": f"Invalid slots or recurrence: {err}"}), 400
+    if not slots or len(slots) > BULK_BOOKING_MAX:
+        return jsonify({"message": f"Give between 1 and {BULK_BOOKING_MAX} slots"}), 400
+    if len(set(slots)) != len(slots):
+        return jsonify({"message": "A slot is listed more than once"}), 400
+
+    fresh = False
+    for _ in range(BULK_BOOKING_ATTEMPTS):
+        department_id, bookable, rejected = check_bulk_slots(doctor_id, slots, fresh)
+        rejected_json = [slot_json(*slot, reason=reason) for slot, reason in rejected.items()]
+        if (rejected and mode == "all_or_nothing") or not bookable:
+            status = 409 if "Already booked" in rejected.values() else 400
+            return jsonify({"message": "No appointments were booked", "booked": [], "rejected": rejected_json}), status
+
+        rows = [
+            {
+                "doctor_id": doctor_id,
+                "patient_id": patient_id,
+                "department_id": department_id,
+                "date": slot_date,
+                "time": slot_time,
+                "status": "Booked",
+            }
+            for slot_date, slot_time in bookable
+        ]
+        try:
+            # one multi-row INSERT; ids come back keyed by slot since RETURNING order is not guaranteed
+            table = Appointment.__table__
+            ids = {
+                (row.date, row.time): row.id
+                for row in db.session.execute(insert(table).returning(table.c.id, table.c.date, table.c.time), rows)
+            }
+            count_appointments([slot_date for slot_date, _ in bookable], department_id, "Booked")
+            bump_availability_version(doctor_id, [(slot_date, slot_time, True) for slot_date, slot_time in bookable])
+            db.session.commit()
+        except IntegrityError:
+            # someone took one of the slots after the check: nothing was written
+            db.session.rollback()
+            if mode == "all_or_nothing":
+                return jsonify({"message": "A slot was booked by someone else meanwhile; no appointments were booked"}), 409
+            fresh = True
+            continue
+        booked = [slot_json(slot_date, slot_time, id=ids[(slot_date, slot_time)]) for slot_date, slot_time in bookable]
+        return jsonify({
+            "message": f"Booked {len(booked)} of {len(slots)} appointments",
+            "booked": booked,
+            "rejected": rejected_json,
+        }), 201
+
+    return jsonify({"message": "Slots kept changing, please try again"}), 409
+
+
 # # Doctor: Get current availability
-# @app.route("/doctor/availability", methods=["GET"])
+# @bp.route("/doctor/availability", methods=["GET"])
 # @jwt_required()
 # def get_my_availability():
 #     claims = get_jwt()
@@ -747,7 +2506,7 @@ def book_appointment():
 
 
 # # Doctor: Update availability
-# @app.route("/doctor/availability", methods=["POST"])
+# @bp.route("/doctor/availability", methods=["POST"])
 # @jwt_required()
 # def update_my_availability():
 #     claims = get_jwt()
@@ -766,7 +2525,8 @@ def book_appointment():
 
 #     return jsonify({"message": "Availability updated successfully"}), 200
 
-@app.route("/doctor/availability", methods=["GET", "POST"])
+@bp.route("/doctor/availability", methods=["GET", "POST"])
+@use_primary
 @jwt_required()
 def doctor_availability():
     claims = get_jwt()
@@ -777,18 +2537,24 @@ def doctor_availability():
     if not profile:
         return jsonify({"message": "Doctor profile not found"}), 404
 
-    # ✅ GET: return current availability
+    # ✅ GET: return current availability as {date: bool}
     if request.method == "GET":
-        availability = json.loads(profile.availability) if profile.availability else {}
+        rows = DoctorAvailability.query.filter_by(doctor_id=doctor_id).order_by(DoctorAvailability.date).all()
+        availability = {row.date.isoformat(): row.available for row in rows}
         return jsonify({"availability": availability}), 200
 
-    # ✅ POST: update availability
+    # ✅ POST: upsert the dates sent; dates not mentioned are left untouched
     data = request.get_json() or {}
     availability = data.get("availability")
     if not availability:
         return jsonify({"message": "No availability data received"}), 400
 
-    profile.availability = json.dumps(availability)
+    try:
+        parsed = parse_availability(availability)
+        save_doctor_availability(doctor_id, parsed)
+    except (ValueError, TypeError) as e:
+        db.session.rollback()
+        return jsonify({"message": f"Invalid availability data: {e}"}), 400
     db.session.commit()
 
     return jsonify({"message": "Availability updated successfully"}), 200
@@ -797,7 +2563,8 @@ def doctor_availability():
 # ---------------------------
 # PATIENT endpoints
 # ---------------------------
-@app.route("/patient/profile", methods=["GET", "POST"])
+@bp.route("/patient/profile", methods=["GET", "POST"])
+@use_primary
 @jwt_required()
 def patient_profile():
     claims = get_jwt()
@@ -828,56 +2595,145 @@ def patient_profile():
     return jsonify({"message": "saved"}), 200
 
 
-@app.route("/patient/dashboard", methods=["GET"])
+@bp.route("/patient/dashboard", methods=["GET"])
 @jwt_required()
 def patient_dashboard():
     claims = get_jwt()
     if claims.get("role") != "patient":
         return jsonify({"message": "Unauthorized", "category": "danger"}), 403
 
-    user_id = claims.get("user_id")
-    patient = db.session.get(User, user_id)
-    if not patient:
-        return jsonify({"message": "Patient not found", "category": "danger"}), 404
-
-    # Get all departments
-    departments = Department.query.all()
-    dept_list = [{"id": d.id, "name": d.name, "description": d.description} for d in departments]
-
+    # the token identity is the patient's username, so no user lookup is needed
     return jsonify({
         "message": "Dashboard loaded successfully",
         "category": "success",
-        "patient": patient.username,
-        "departments": dept_list
+        "patient": get_jwt_identity(),
+        "departments": cached_departments()[0]
     }), 200
 
-@app.route("/departments/<int:dept_id>", methods=["GET"])
+@bp.route("/departments/<int:dept_id>", methods=["GET"])
+@use_primary
 @jwt_required()
 def get_department_details(dept_id):
-    # Get department info
+    details, etag = cached_department_details(dept_id)
+    if details is None:
+        return jsonify({"message": "Department not found"}), 404
+    return conditional_json(etag, lambda: details)
+
+
+@bp.route("/departments/<int:dept_id>/next-available", methods=["GET"])
+@use_primary
+@jwt_required()
+def get_department_next_available(dept_id):
+    """Earliest free slots across every approved doctor in a department.
+
+    ?after=YYYY-MM-DD[THH:MM] (default now), ?limit=N (default 10); looks
+    NEXT_AVAILABLE_HORIZON_DAYS ahead.
+    """
+    try:
+        after = DateTime.fromisoformat(request.args["after"]) if request.args.get("after") else DateTime.now()
+        limit = min(int(request.args.get("limit", 10)), NEXT_AVAILABLE_LIMIT_MAX)
+    except ValueError:
+        return jsonify({"message": "after must be YYYY-MM-DD or YYYY-MM-DDTHH:MM and limit a number"}), 400
+    if limit < 1:
+        return jsonify({"message": "limit must be at least 1"}), 400
+    if after.tzinfo is not None:
+        # slots are naive local times and cannot be compared with an offset
+        return jsonify({"message": "after must be a local date/time without a UTC offset"}), 400
+
+    details, _ = cached_department_details(dept_id)
+    if details is None:
+        return jsonify({"message": "Department not found"}), 404
+    names = {doctor["id"]: doctor["name"] for doctor in details["doctors"]}
+
+    index = free_slot_index(list(names), dept_id) if names else {}
+    return jsonify({
+        "department_id": dept_id,
+        "slots": [
+            {
+                "doctor_id": doctor_id,
+                "doctor_name": names[doctor_id],
+                "date": slot.date().isoformat(),
+                "time": slot.strftime(LABEL_FORMAT),
+            }
+            for slot, doctor_id in next_free_slots(index, after, limit)
+        ],
+    }), 200
+
+
+@bp.route("/departments/<int:dept_id>/slot-events", methods=["GET"])
+@stream_token_required
+def department_slot_events(dept_id):
+    """Slot events for every doctor the department lists when the stream opens."""
+    details, _ = cached_department_details(dept_id)
+    if details is None:
+        return jsonify({"message": "Department not found"}), 404
+    return slot_event_stream(doctor["id"] for doctor in details["doctors"])
+
+
+@bp.route("/departments/<int:dept_id>/availability", methods=["GET"])
+@use_primary
+@jwt_required()
+def get_department_availability(dept_id):
+    """Free slots for every approved doctor in a department, in one request."""
+    try:
+        date_from = parse_date_arg("from", DateTime.now().date())
+        date_to = parse_date_arg("to")
+    except ValueError:
+        return jsonify({"message": "Invalid date format, expected YYYY-MM-DD"}), 400
+
     dept = db.session.get(Department, dept_id)
     if not dept:
         return jsonify({"message": "Department not found"}), 404
 
-    # Get doctors who specialize in this department
-    doctors = (
-        db.session.query(User, DoctorProfile)
+    # doctors joined with their available days in the window ...
+    rows = (
+        db.session.query(
+            User.id,
+            User.username,
+            DoctorProfile.experience,
+            DoctorAvailability,
+        )
         .join(DoctorProfile, DoctorProfile.user_id == User.id)
+        .outerjoin(
+            DoctorAvailability,
+            and_(
+                DoctorAvailability.doctor_id == User.id,
+                DoctorAvailability.available == True,
+                DoctorAvailability.date >= date_from,
+                DoctorAvailability.date <= (date_to or Date.max),
+            ),
+        )
         .filter(
             User.role == "doctor",
             User.approve == True,
             DoctorProfile.specialization_id == dept_id
         )
+        .order_by(User.id, DoctorAvailability.date)
         .all()
     )
 
-    doctor_list = []
-    for user, profile in doctors:
-        doctor_list.append({
-            "id": user.id,
-            "name": user.username,
-            "experience": profile.experience,
-        })
+    doctors = {}
+    for doctor_id, username, experience, day in rows:
+        entry = doctors.setdefault(doctor_id, {"name": username, "experience": experience, "days": []})
+        if day is not None:
+            entry["days"].append(day)
+
+    # ... and their booked slots, from the occupancy cache where it is current
+    occupied = occupied_slots(
+        availability_versions(list(doctors)),
+        {doctor_id: [day.date for day in entry["days"]] for doctor_id, entry in doctors.items()},
+    )
+
+    schedules = schedules_for((doctor_id, dept_id) for doctor_id in doctors)
+    doctor_list = [
+        {
+            "id": doctor_id,
+            "name": entry["name"],
+            "experience": entry["experience"],
+            "availability": free_slot_days(entry["days"], occupied[doctor_id], schedules[doctor_id]),
+        }
+        for doctor_id, entry in doctors.items()
+    ]
 
     return jsonify({
         "department": {
@@ -889,9 +2745,8 @@ def get_department_details(dept_id):
     }), 200
 
 
-
-
-@app.route("/patient/appointments", methods=["GET"])
+@bp.route("/patient/appointments", methods=["GET"])
+@use_primary
 @jwt_required()
 def patient_appointments():
     claims = get_jwt()
@@ -900,15 +2755,20 @@ def patient_appointments():
 
     user_id = claims.get("user_id")
 
-    appts = Appointment.query.filter_by(patient_id=user_id)\
-        .order_by(Appointment.date.desc(), Appointment.time.desc()).all()
+    query = Appointment.query.filter_by(patient_id=user_id).options(
+        joinedload(Appointment.doctor), joinedload(Appointment.department)
+    )
+    try:
+        appts, next_cursor = paginate_appointments(query, descending=True)
+    except ValueError:
+        return jsonify({"message": "Invalid cursor, date filter or limit"}), 400
 
     result = []
     for a in appts:
         result.append({
             "id": a.id,
-            "date": str(a.date),
-            "time": str(a.time),
+            "date": a.date,
+            "time": a.time,
             "status": a.status,
             "remarks": a.remarks,
 
@@ -918,10 +2778,10 @@ def patient_appointments():
             "can_cancel": a.status.lower() == "booked"
         })
 
-    return jsonify(result), 200
+    return jsonify({"appointments": result, "next_cursor": next_cursor}), 200
 
 
-@app.route("/patient/appointments/<int:appointment_id>/cancel", methods=["POST"])
+@bp.route("/patient/appointments/<int:appointment_id>/cancel", methods=["POST"])
 @jwt_required()
 def patient_cancel_appointment(appointment_id):
     claims = get_jwt()
@@ -934,11 +2794,14 @@ def patient_cancel_appointment(appointment_id):
     if appt.status != "Booked":
         return jsonify({"message": "Only booked appointments can be cancelled"}), 400
     appt.status = "Cancelled"
+    count_appointment(appt, "Booked", -1)
+    count_appointment(appt, "Cancelled")
+    bump_availability_version(appt.doctor_id, [(appt.date, appt.time, False)])
     db.session.commit()
     return jsonify({"message": "cancelled"}), 200
 
 
-@app.route("/patient/treatments", methods=["GET"])
+@bp.route("/patient/treatments", methods=["GET"])
 @jwt_required()
 def patient_treatments():
     claims = get_jwt()
@@ -953,7 +2816,7 @@ def patient_treatments():
     return jsonify(out), 200
 
 
-@app.route("/patient/export_treatments", methods=["GET"])
+@bp.route("/patient/export_treatments", methods=["GET"])
 @jwt_required()
 def patient_export_treatments():
     claims = get_jwt()
@@ -964,20 +2827,18 @@ def patient_export_treatments():
     return jsonify({"task_id": task.id}), 202
 
 
-@app.route("/reports/download/<path:filename>", methods=["GET"])
+@bp.route("/reports/download/<path:filename>", methods=["GET"])
 @jwt_required()
 def reports_download(filename):
     # allow admins or owner check in prod; for now keep minimal checks
     return send_from_directory(REPORTS_DIR, filename, as_attachment=True)
 
-@app.route('/departments', methods=['GET'])
+@bp.route('/departments', methods=['GET'])
+@use_primary
 @jwt_required(optional=True)
 def get_departments():
-    departments = Department.query.all()
-    return jsonify([{
-        "id": d.id,
-        "name": d.name, "description": d.description
-    } for d in departments]), 200
+    departments, etag = cached_departments()
+    return conditional_json(etag, lambda: departments)
 
 
 
@@ -985,82 +2846,536 @@ def get_departments():
 # CELERY tasks
 # ---------------------------
 
+# messages handed to each send_mail_batch subtask (one SMTP connection each)
+MAIL_BATCH_SIZE = 100
+
+
+def queue_mail_batches(messages):
+    """Split message dicts into batches and send them as parallel Celery subtasks."""
+    batches = [messages[i:i + MAIL_BATCH_SIZE] for i in range(0, len(messages), MAIL_BATCH_SIZE)]
+    if batches:
+        group(send_mail_batch.s(batch) for batch in batches).apply_async()
+    return {"messages": len(messages), "batches": len(batches)}
+
+
 @celery.task(name="tasks.daily_reminder")
 def daily_reminder():
+    g.use_replica = True
     today = DateTime.now().date()
-    appts = Appointment.query.filter_by(date=today, status="Booked").all()
-    for a in appts:
-        patient = User.query.get(a.patient_id)
-        doctor = User.query.get(a.doctor_id)
-        if patient and "@" in patient.username:
-            try:
-                msg = Message(subject="Appointment Reminder", recipients=[patient.username], body=f"Reminder: Appointment with Dr {doctor.username if doctor else 'N/A'} at {a.time} on {a.date}")
-                mail.send(msg)
-            except Exception:
-                pass
-    return "done"
+    Patient = aliased(User)
+    Doctor = aliased(User)
+    # patients and doctors resolved in the same query as today's appointments
+    rows = (
+        db.session.query(Patient.username, Doctor.username, Appointment.date, Appointment.time)
+        .join(Patient, Patient.id == Appointment.patient_id)
+        .outerjoin(Doctor, Doctor.id == Appointment.doctor_id)
+        .filter(
+            Appointment.date == today,
+            Appointment.status == "Booked",
+            Patient.username.contains("@"),
+        )
+        .order_by(Appointment.time)
+        .all()
+    )
+    return queue_mail_batches([
+        {
+            "recipient": patient,
+            "subject": "Appointment Reminder",
+            "body": f"Reminder: Appointment with Dr {doctor or 'N/A'} at {appt_time} on {appt_date}",
+        }
+        for patient, doctor, appt_date, appt_time in rows
+    ])
+
+
+@celery.task(name="tasks.send_mail_batch", bind=True, max_retries=3, default_retry_delay=60)
+def send_mail_batch(self, messages):
+    """Send a batch of {recipient, subject, body|html} dicts over one SMTP connection.
+
+    A message that fails is logged and reported in the result; it does not
+    stop the rest of the batch. Failing to connect, or losing the connection
+    part way, retries the task with the messages not yet attempted.
+    """
+    sent = 0
+    failed = []
+    try:
+        with mail.connect() as conn:
+            for m in messages:
+                try:
+                    conn.send(Message(subject=m["subject"], recipients=[m["recipient"]], body=m.get("body"), html=m.get("html")))
+                    sent += 1
+                except smtplib.SMTPServerDisconnected:
+                    raise  # every later send would fail too; retry this one and the rest
+                except Exception as e:
+                    current_app.logger.warning("Mail to %s failed: %s", m["recipient"], e)
+                    failed.append({"recipient": m["recipient"], "error": str(e)})
+    except (smtplib.SMTPException, OSError) as e:
+        # could not connect, lost the connection, or quit failed: retry whatever was not sent yet
+        remaining = messages[sent + len(failed):]
+        if remaining:
+            raise self.retry(exc=e, args=[remaining])
+    return {"sent": sent, "failed": failed}
+
+
+def claim_outbox(ids=None, limit=OUTBOX_DRAIN_LIMIT):
+    """Claim due outbox rows for this worker and return them.
+
+    The claim pushes next_attempt_at past now in the same UPDATE that selects
+    the rows, so a concurrent drain skips them without needing row locks.
+    """
+    now = DateTime.now()
+    token = uuid.uuid4().hex
+    due = (
+        db.select(EmailOutbox.id)
+        .where(EmailOutbox.status == "Pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(limit)
+    )
+    if ids:
+        due = due.where(EmailOutbox.id.in_(ids))
+    db.session.execute(
+        update(EmailOutbox)
+        .where(
+            EmailOutbox.id.in_(due.scalar_subquery()),
+            EmailOutbox.status == "Pending",
+            EmailOutbox.next_attempt_at <= now,
+        )
+        .values(
+            claim_token=token,
+            attempts=EmailOutbox.attempts + 1,
+            next_attempt_at=now + timedelta(seconds=OUTBOX_CLAIM_SECONDS),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return EmailOutbox.query.filter_by(claim_token=token).order_by(EmailOutbox.id).all()
+
+
+def outbox_failed(email, error):
+    """Schedule a retry with exponential backoff, or dead-letter the row after the last attempt."""
+    email.last_error = str(error)[:1000]
+    email.claim_token = None
+    if email.attempts >= OUTBOX_MAX_ATTEMPTS:
+        email.status = "Dead"
+        current_app.logger.error("Outbox mail %s to %s dead after %s attempts: %s",
+                         email.id, email.recipient, email.attempts, error)
+    else:
+        delay = OUTBOX_RETRY_BASE_SECONDS * 2 ** (email.attempts - 1)
+        email.next_attempt_at = DateTime.now() + timedelta(seconds=delay)
+
+
+@celery.task(name="tasks.deliver_outbox")
+def deliver_outbox(ids=None):
+    """Send pending outbox mail over one SMTP connection.
+
+    Called with ids right after a request commits, and without ids by the
+    periodic drain, which also picks up rows whose retry is due.
+    """
+    emails = claim_outbox(ids)
+    if not emails:
+        return {"sent": 0, "failed": 0, "dead": 0}
+    sent = failed = 0
+    pending = deque(emails)
+    reconnects = 0
+    while pending:
+        try:
+            with mail.connect() as conn:
+                while pending:
+                    email = pending[0]
+                    try:
+                        conn.send(Message(subject=email.subject, recipients=[email.recipient], body=email.body, html=email.html))
+                    except smtplib.SMTPServerDisconnected:
+                        raise  # the connection is gone, not this message's fault
+                    except Exception as e:
+                        outbox_failed(email, e)
+                        failed += 1
+                    else:
+                        email.status = "Sent"
+                        email.sent_at = DateTime.now()
+                        email.claim_token = None
+                        sent += 1
+                    pending.popleft()
+                    db.session.commit()
+        except (smtplib.SMTPException, OSError) as e:
+            if pending and isinstance(e, smtplib.SMTPServerDisconnected) and reconnects < OUTBOX_RECONNECTS:
+                reconnects += 1
+                continue
+            # could not connect: back off everything still claimed
+            for email in pending:
+                outbox_failed(email, e)
+                failed += 1
+            db.session.commit()
+            break
+    dead = sum(1 for email in emails if email.status == "Dead")
+    return {"sent": sent, "failed": failed, "dead": dead}
+
+
+# compiled once at import; rendered per doctor
+MONTHLY_ACTIVITY_TEMPLATE = Template(
+    "<h2>Activity for {{ doctor }} - {{ period }}</h2>"
+    "<p>Slots offered: {{ offered }}; booked or completed: {{ used }}</p><ul>"
+    "{% for a in appointments %}<li>{{ a.date }} {{ a.time }} - {{ a.status }}</li>{% endfor %}"
+    "</ul>",
+    autoescape=True,
+)
 
 
 @celery.task(name="tasks.monthly_doctor_activity")
-def monthly_doctor_activity():
-    doctors = User.query.filter_by(role="doctor", approve=True).all()
+def monthly_doctor_activity(year=None, month=None):
+    """Email each doctor their activity for year/month; by default the month just ended.
+
+    Beat runs this on the 1st, so "now" is a few hours into the new month.
+    """
+    g.use_replica = True
     now = DateTime.now()
-    month = now.month
-    for d in doctors:
-        appts = Appointment.query.filter(Appointment.doctor_id == d.id, func.strftime("%m", Appointment.date) == f"{month:02d}").all()
-        html = f"<h2>Activity for {d.username} - {now.strftime('%B %Y')}</h2><ul>"
-        for a in appts:
-            html += f"<li>{a.date} {a.time} - {a.status}</li>"
-        html += "</ul>"
-        if "@" in d.username:
-            try:
-                msg = Message(subject=f"Monthly Activity - {now.strftime('%B %Y')}", recipients=[d.username], html=html)
-                mail.send(msg)
-            except Exception:
-                pass
-    return "done"
+    if month is None:
+        last_month = now.date().replace(day=1) - timedelta(days=1)
+        month_start = Date(year or last_month.year, last_month.month, 1)
+    else:
+        month_start = Date(year or now.year, month, 1)
+    next_month = Date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+    period = month_start.strftime("%B %Y")
+
+    # every approved doctor with an email, joined to that month's appointments
+    # through a plain date range (index-friendly, and scoped to the right year)
+    rows = (
+        db.session.query(User.id, User.username, Appointment)
+        .outerjoin(
+            Appointment,
+            and_(
+                Appointment.doctor_id == User.id,
+                Appointment.date >= month_start,
+                Appointment.date < next_month,
+            ),
+        )
+        .filter(User.role == "doctor", User.approve == True, User.username.contains("@"))
+        .order_by(User.id, Appointment.date, Appointment.time)
+        .all()
+    )
+
+    # slots offered that month, counted on the same grid patients book from
+    days = (
+        db.session.query(DoctorAvailability, DoctorProfile.specialization_id)
+        .outerjoin(DoctorProfile, DoctorProfile.user_id == DoctorAvailability.doctor_id)
+        .filter(
+            DoctorAvailability.available == True,
+            DoctorAvailability.date >= month_start,
+            DoctorAvailability.date < next_month,
+        )
+        .all()
+    )
+    schedules = schedules_for({(day.doctor_id, department_id) for day, department_id in days})
+    offered = Counter()
+    for day, _ in days:
+        offered[day.doctor_id] += len(day_grid(schedules[day.doctor_id], day).times)
+
+    messages = []
+    for (doctor_id, username), group_rows in groupby(rows, key=lambda r: (r[0], r[1])):
+        appointments = [appt for _, _, appt in group_rows if appt is not None]
+        messages.append({
+            "recipient": username,
+            "subject": f"Monthly Activity - {period}",
+            "html": MONTHLY_ACTIVITY_TEMPLATE.render(
+                doctor=username,
+                period=period,
+                appointments=appointments,
+                offered=offered[doctor_id],
+                used=sum(1 for appt in appointments if appt.status != "Cancelled"),
+            ),
+        })
+    return queue_mail_batches(messages)
+
+
+# rows pulled from the database per round trip while streaming an export
+EXPORT_BATCH_SIZE = 1000
+
+
+# mkstemp creates files 0600; reports get the mode open() would give them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+REPORT_FILE_MODE = 0o666 & ~_UMASK
+
+
+def write_csv_atomically(path, header, rows):
+    """Stream rows into a temp file next to path, then rename it into place.
+
+    Readers of REPORTS_DIR only ever see a complete report; the temp file is
+    hidden and does not end in .csv, so list_reports skips it.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".csv.tmp")
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+        os.chmod(tmp_path, REPORT_FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
 
 
 @celery.task(name="tasks.export_treatments_csv")
 def export_treatments_csv(patient_id):
-    treatments = Treatment.query.join(Appointment).filter(Appointment.patient_id == patient_id).all()
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["appointment_date", "doctor_username", "diagnosis", "prescription", "notes"])
-    for t in treatments:
-        appt = Appointment.query.get(t.appointment_id)
-        doctor = User.query.get(appt.doctor_id) if appt else None
-        writer.writerow([str(appt.date) if appt else "", doctor.username if doctor else "", t.diagnosis, t.prescription, t.notes])
-    os.makedirs(REPORTS_DIR, exist_ok=True)
+    g.use_replica = True
+    # one joined query, streamed in batches instead of loaded with .all()
+    rows = (
+        db.session.query(
+            Appointment.date,
+            User.username,
+            Treatment.diagnosis,
+            Treatment.prescription,
+            Treatment.notes,
+        )
+        .join(Appointment, Treatment.appointment_id == Appointment.id)
+        .outerjoin(User, User.id == Appointment.doctor_id)
+        .filter(Appointment.patient_id == patient_id)
+        .order_by(Appointment.date, Treatment.id)
+        .yield_per(EXPORT_BATCH_SIZE)
+    )
     path = os.path.join(REPORTS_DIR, f"patient_{patient_id}_treatments.csv")
-    with open(path, "w", newline="") as f:
-        f.write(output.getvalue())
-    return path
+    return write_csv_atomically(
+        path,
+        ["appointment_date", "doctor_username", "diagnosis", "prescription", "notes"],
+        (
+            [str(appt_date) if appt_date else "", doctor or "", diagnosis, prescription, notes]
+            for appt_date, doctor, diagnosis, prescription, notes in rows
+        ),
+    )
 
 
 @celery.task(name="tasks.export_professional_service_requests")
 def export_professional_service_requests(professional_id):
-    appts = Appointment.query.filter_by(doctor_id=professional_id).all()
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["appointment_id", "patient_id", "date", "time", "status", "remarks"])
-    for a in appts:
-        writer.writerow([a.id, a.patient_id, str(a.date), str(a.time), a.status, a.remarks])
-    os.makedirs(REPORTS_DIR, exist_ok=True)
+    g.use_replica = True
+    rows = (
+        db.session.query(
+            Appointment.id,
+            Appointment.patient_id,
+            Appointment.date,
+            Appointment.time,
+            Appointment.status,
+            Appointment.remarks,
+        )
+        .filter(Appointment.doctor_id == professional_id)
+        .order_by(Appointment.date, Appointment.time, Appointment.id)
+        .yield_per(EXPORT_BATCH_SIZE)
+    )
     path = os.path.join(REPORTS_DIR, f"doctor_{professional_id}_appointments.csv")
-    with open(path, "w", newline="") as f:
-        f.write(output.getvalue())
-    return path
+    return write_csv_atomically(
+        path,
+        ["appointment_id", "patient_id", "date", "time", "status", "remarks"],
+        (
+            [appt_id, patient_id, str(appt_date), str(appt_time), status, remarks]
+            for appt_id, patient_id, appt_date, appt_time, status, remarks in rows
+        ),
+    )
 
 
 # Celery beat schedule (if you run celery beat)
 celery.conf.beat_schedule = {
     "daily-reminder": {"task": "tasks.daily_reminder", "schedule": crontab(hour=8, minute=0)},
     "monthly-doctor-activity": {"task": "tasks.monthly_doctor_activity", "schedule": crontab(hour=7, minute=0, day_of_month=1)},
+    "drain-email-outbox": {"task": "tasks.deliver_outbox", "schedule": 60.0},
 }
 
+@celery.task(name="tasks.sync_sqlite_replica")
+def sync_sqlite_replica_task():
+    return sync_sqlite_replica()
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+@bp.cli.command("sync-replica")
+def sync_replica_command():
+    """Copy the primary SQLite database into the SQLite read replica."""
+    if sync_sqlite_replica():
+        click.echo("Replica synced")
+    else:
+        click.echo("No SQLite read replica configured")
+
+
+@bp.cli.command("init-db")
+def init_db_command():
+    """Create tables and the default admin, and run data migrations."""
+    init_db_and_admin()
+    click.echo("Database initialized")
+
+
+@bp.cli.command("cancel-duplicate-bookings")
+@click.option("--yes", is_flag=True, help="cancel without asking")
+def cancel_duplicate_bookings_command(yes):
+    """List doubly-booked slots, then cancel all but the earliest booking of each."""
+    appts = duplicate_bookings()
+    if not appts:
+        click.echo("No duplicate bookings")
+        return
+    click.echo(f"{len(appts)} booking(s) share a slot with an earlier booking:")
+    for appt in appts:
+        click.echo(f"  appointment {appt.id}: doctor {appt.doctor_id}, patient {appt.patient_id}, {appt.date} {appt.time}")
+    if not yes and not click.confirm("Cancel these bookings?"):
+        click.echo("Nothing changed")
+        return
+    cancel_duplicate_bookings(appts)
+    ensure_indexes()
+    click.echo(f"Cancelled {len(appts)} booking(s)")
+
+
+@bp.cli.command("bench-appointment-indexes")
+@click.option("--rows", default=200000, show_default=True, help="appointments in the synthetic table")
+def bench_appointment_indexes(rows):
+    """Query plans and timings of the hot appointment queries without and with the indexes.
+
+    Runs against a throwaway in-memory SQLite database, not the configured one.
+    """
+    table = Appointment.__table__
+    engine = create_engine("sqlite://")
+    today = DateTime.now().date()
+    queries = {
+        "doctor availability (doctor, date range, Booked)": select(table.c.date, table.c.time).where(
+            table.c.doctor_id == 7, table.c.status == "Booked",
+            table.c.date >= today, table.c.date <= today + timedelta(days=30),
+        ),
+        "patient list (patient, order by date, time)": select(table.c.id).where(
+            table.c.patient_id == 42,
+        ).order_by(table.c.date, table.c.time),
+        "daily reminders (date, Booked)": select(table.c.id).where(
+            table.c.date == today, table.c.status == "Booked",
+        ),
+    }
+    with engine.begin() as conn:
+        table.create(conn)
+        for index in list(table.indexes):
+            index.drop(conn)
+        conn.execute(insert(table), [
+            {
+                "doctor_id": i % 500,
+                "patient_id": i % 5000,
+                "date": today + timedelta(days=i % 365 - 180),
+                "time": Time(11 + i % 6, 30 * (i // 6 % 2)),
+                "status": ("Booked", "Completed", "Cancelled")[i % 3],
+            }
+            for i in range(rows)
+        ])
+
+        def run(label):
+            click.echo(label)
+            for name, query in queries.items():
+                sql = str(query.compile(conn, compile_kwargs={"literal_binds": True}))
+                plan = "; ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))
+                started = time.perf_counter()
+                for _ in range(20):
+                    conn.exec_driver_sql(sql).fetchall()
+                took = (time.perf_counter() - started) / 20 * 1000
+                click.echo(f"  {name}: {took:.2f} ms  [{plan}]")
+
+        run(f"{rows} rows, no indexes:")
+        for index in table.indexes:
+            if not index.unique:
+                index.create(conn)
+        run("with the appointments indexes:")
+
+
+@bp.cli.command("bench-password-hash")
+@click.option("--method", default=None, help="werkzeug hash method (default: PASSWORD_HASH_METHOD)")
+@click.option("--seconds", default=5.0, show_default=True, help="how long to verify for")
+def bench_password_hash(method, seconds):
+    """Measure password verifications per second on one core, i.e. logins/s/core."""
+    method = method or current_app.config["PASSWORD_HASH_METHOD"]
+    hashed = generate_password_hash("benchmark-password", method=method)
+    checks = 0
+    started = time.thread_time()
+    while time.thread_time() - started < seconds:
+        check_password_hash(hashed, "benchmark-password")
+        checks += 1
+    elapsed = time.thread_time() - started
+    click.echo(f"{_hash_prefix(method)}: {checks / elapsed:.1f} logins/s/core, {elapsed * 1000 / checks:.1f} ms CPU each")
+
+
+@bp.cli.command("bench-json")
+@click.option("--rows", default=50000, show_default=True, help="appointments in the payload")
+def bench_json(rows):
+    """Time JSON encoding and measure response size for an appointment list payload."""
+    today = DateTime.now().date()
+    payload = {
+        "appointments": [
+            {"id": i, "patient_id": i % 5000, "doctor_id": i % 200, "date": today + timedelta(days=i % 365),
+             "time": Time(9 + i % 8, 30 * (i % 2)), "status": "Booked", "remarks": None}
+            for i in range(rows)
+        ],
+        "next_cursor": None,
+    }
+    provider = current_app.json
+    encoders = [("stdlib", lambda obj: DefaultJSONProvider.dumps(provider, obj, separators=(",", ":")))]
+    if orjson is not None:
+        encoders.append(("orjson", provider.dumps))
+    level = current_app.config["COMPRESS_LEVEL"]
+    for name, dumps in encoders:
+        started = time.perf_counter()
+        body = dumps(payload).encode()
+        elapsed = time.perf_counter() - started
+        click.echo(f"{name}: {elapsed * 1000:.1f} ms, {len(body)} bytes")
+    started = time.perf_counter()
+    gz = gzip.compress(body, compresslevel=level)
+    click.echo(f"gzip level {level}: {len(gz)} bytes in {(time.perf_counter() - started) * 1000:.1f} ms")
+    if brotli is not None:
+        started = time.perf_counter()
+        br = brotli.compress(body, quality=min(level, 11))
+        click.echo(f"brotli quality {min(level, 11)}: {len(br)} bytes in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+@bp.cli.command("bench-next-available")
+@click.option("--doctors", default=40, show_default=True, help="doctors in the synthetic department")
+@click.option("--limit", default=10, show_default=True, help="slots to return")
+@click.option("--department", type=int, default=None, help="also time the index of this department in the configured database")
+def bench_next_available(doctors, limit, department):
+    """Time the next-available search: full scan and sort versus bisect + heapq.merge."""
+    today = DateTime.combine(DateTime.now().date(), Time())
+    index = {
+        doctor_id: [
+            today + timedelta(days=day, hours=11, minutes=30 * step)
+            for day in range(NEXT_AVAILABLE_HORIZON_DAYS)
+            for step in range(12)
+            if (doctor_id + day + step) % 3
+        ]
+        for doctor_id in range(doctors)
+    }
+    after = today + timedelta(days=NEXT_AVAILABLE_HORIZON_DAYS // 2, hours=14)
+
+    def scan():
+        return sorted(
+            (slot, doctor_id) for doctor_id, slots in index.items() for slot in slots if slot >= after
+        )[:limit]
+
+    assert scan() == next_free_slots(index, after, limit)
+    click.echo(f"{doctors} doctors x {NEXT_AVAILABLE_HORIZON_DAYS} days, {sum(map(len, index.values()))} free slots:")
+    for name, search in (("scan + sort", scan), ("bisect + merge", lambda: next_free_slots(index, after, limit))):
+        started = time.perf_counter()
+        for _ in range(50):
+            search()
+        click.echo(f"  {name}: {(time.perf_counter() - started) / 50 * 1000:.3f} ms")
+
+    if department is not None:
+        details, _ = cached_department_details(department)
+        if details is None:
+            raise click.ClickException("Department not found")
+        doctor_ids = [doctor["id"] for doctor in details["doctors"]]
+        for doctor_id in doctor_ids:
+            FREE_SLOT_INDEX.pop(doctor_id)
+        for label in ("cold index", "warm index"):
+            started = time.perf_counter()
+            next_free_slots(free_slot_index(doctor_ids, department), DateTime.now(), limit)
+            click.echo(f"department {department}, {label}: {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+app = create_app()
+
 # ---------------------------
 # Run
 # ---------------------------
 if __name__ == "__main__":
+    with app.app_context():
+        init_db_and_admin()
     app.run(debug=True)
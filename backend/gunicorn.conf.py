@@ -0,0 +1,26 @@
+# gunicorn.conf.py
+"""Production server settings; run from backend/ with `gunicorn app:app`.
+
+Workers are gevent workers: every slot event stream (SSE) stays open for as
+long as the page does, and under gevent it waits as a parked greenlet instead
+of holding a worker thread.
+
+gunicorn reads this file before it imports the app, so threading is patched
+here rather than by the worker. With --preload, app.py (the SQLAlchemy
+engines and their pool locks, TTLCache and SlotEventBroker locks) is
+imported in the master before any worker starts; patching late would leave
+those as real thread locks that block the whole gevent hub while waiting.
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import os  # noqa: E402
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+worker_class = "gevent"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+# open connections per worker, slot event streams included
+worker_connections = int(os.environ.get("WORKER_CONNECTIONS", 1000))
+# the gevent worker heartbeats on its own, so a long stream does not trip this
+timeout = 30
@@ -1,6 +1,39 @@
+from datetime import time
+
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+
+
+class RoutingSession(Session):
+    """Session that can send reads to a "replica" bind.
+
+    Plain SELECTs go to the replica when the current request or task has set
+    g.use_replica and a replica bind is configured. Writes, flushes and
+    SELECT ... FOR UPDATE always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and clause is not None
+            and clause.is_select
+            and getattr(clause, "_for_update_arg", None) is None
+            and has_app_context()
+            and g.get("use_replica")
+        ):
+            replica = self._db.engines.get("replica")
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
 
-db = SQLAlchemy()
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# default working hours for a doctor's available day
+DEFAULT_DAY_START = time(11, 0)
+DEFAULT_DAY_END = time(17, 0)
 
 
 # ===========================
@@ -57,6 +90,63 @@ class DoctorProfile(db.Model):
             "availability": self.availability,
         }
 
+# ===========================
+# Doctor Availability (one row per doctor per date)
+# ===========================
+class DoctorAvailability(db.Model):
+    __tablename__ = 'doctor_availability'
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    available = db.Column(db.Boolean, default=True, nullable=False)
+    start_time = db.Column(db.Time, default=DEFAULT_DAY_START, nullable=False)
+    end_time = db.Column(db.Time, default=DEFAULT_DAY_END, nullable=False)
+
+    # unique (doctor_id, date) doubles as the index for per-doctor range queries
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'date', name='uq_doctor_availability_doctor_date'),
+    )
+
+    def as_dict(self):
+        return {
+            "date": self.date.isoformat(),
+            "available": self.available,
+            "start_time": self.start_time.strftime("%H:%M"),
+            "end_time": self.end_time.strftime("%H:%M"),
+        }
+
+class WorkingHours(db.Model):
+    """Slot settings for one doctor or one department.
+
+    NULL fields inherit: doctor row -> department row -> built-in defaults.
+    """
+    __tablename__ = 'working_hours'
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), unique=True)
+    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), unique=True)
+    day_start = db.Column(db.Time)  # default window for newly opened days
+    day_end = db.Column(db.Time)
+    slot_minutes = db.Column(db.Integer)
+    breaks = db.Column(db.String(200))  # e.g. "13:00-14:00,16:00-16:15"; "" = no breaks
+
+    def as_dict(self):
+        return {
+            "doctor_id": self.doctor_id,
+            "department_id": self.department_id,
+            "day_start": self.day_start.strftime("%H:%M") if self.day_start else None,
+            "day_end": self.day_end.strftime("%H:%M") if self.day_end else None,
+            "slot_minutes": self.slot_minutes,
+            "breaks": self.breaks,
+        }
+
+
+class AvailabilityVersion(db.Model):
+    """Per-doctor counter bumped whenever the doctor's free slots may have changed (used for ETags)."""
+    __tablename__ = 'availability_versions'
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
 # ===========================
 # Patient Profile
 # ===========================
@@ -98,6 +188,22 @@ class Appointment(db.Model):
     status = db.Column(db.String(20), default="Booked")  # Booked/Completed/Cancelled
     remarks = db.Column(db.String(200))
 
+    __table_args__ = (
+        # booking / availability lookups and per-doctor range scans
+        db.Index('ix_appointments_doctor_date_time', 'doctor_id', 'date', 'time'),
+        # patient appointment list ordered by date, time
+        db.Index('ix_appointments_patient_date_time', 'patient_id', 'date', 'time'),
+        # daily reminders (date, status) and upcoming counts (date >= today)
+        db.Index('ix_appointments_date_status', 'date', 'status'),
+        # at most one Booked row per doctor slot; cancelled rows may repeat
+        db.Index(
+            'uq_appointments_booked_slot', 'doctor_id', 'date', 'time',
+            unique=True,
+            sqlite_where=db.text("status = 'Booked'"),
+            postgresql_where=db.text("status = 'Booked'"),
+        ),
+    )
+
     patient = db.relationship('User', foreign_keys=[patient_id], backref="patient_appointments")
     doctor = db.relationship('User', foreign_keys=[doctor_id], backref="doctor_appointments")
     department = db.relationship('Department')
@@ -127,3 +233,45 @@ class Treatment(db.Model):
     notes = db.Column(db.Text)
 
     appointment = db.relationship('Appointment')
+
+
+# ===========================
+# Dashboard counters (kept up to date by the write paths)
+# ===========================
+class StatCounter(db.Model):
+    __tablename__ = 'stat_counters'
+    name = db.Column(db.String(50), primary_key=True)  # e.g. "users:doctor"
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class AppointmentDailyStat(db.Model):
+    """Appointment count per (date, department, status); one row per combination."""
+    __tablename__ = 'appointment_daily_stats'
+    date = db.Column(db.Date, primary_key=True)
+    department_id = db.Column(db.Integer, primary_key=True, default=0)  # 0 = no department
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# ===========================
+# Email outbox (written in the same transaction as the change it reports)
+# ===========================
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default="Pending")  # Pending / Sent / Dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    claim_token = db.Column(db.String(32))  # set by the worker that is sending the row
+    created_at = db.Column(db.DateTime, default=db.func.now())
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # drain scan: pending rows that are due
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
@@ -0,0 +1,177 @@
+# slots.py
+"""Slot grid engine shared by availability, booking validation and reports.
+
+A doctor's bookable times on a day come from that day's window
+(DoctorAvailability.start_time / end_time), the slot length and the breaks.
+Slot length, breaks and the window given to newly opened days are set per
+doctor or per department in ``working_hours``; see ``Schedule``.
+
+Grids depend only on (window, slot length, breaks), so each distinct
+combination is built once and shared by every doctor and date that uses it.
+
+Booked slots of a day are an int bitmap with one bit per minute of the day
+(see ``slot_bit``) rather than one bit per grid position. Grids differ from
+day to day and change when working hours are edited, and bookings made on an
+older grid keep their time; keyed by minute, a cached bitmap stays valid
+across such changes and still covers off-grid bookings. The cost is a
+wider int (at most 1440 bits); tests are still one AND per slot.
+"""
+from datetime import datetime, time
+from functools import lru_cache
+from typing import NamedTuple
+
+from sqlalchemy import or_
+
+from models import db, DoctorProfile, WorkingHours, DEFAULT_DAY_START, DEFAULT_DAY_END
+
+DEFAULT_SLOT_MINUTES = 30
+LABEL_FORMAT = "%I:%M %p"  # how slots are shown to and sent back by the frontend
+
+
+class Schedule(NamedTuple):
+    day_start: time = DEFAULT_DAY_START
+    day_end: time = DEFAULT_DAY_END
+    slot_minutes: int = DEFAULT_SLOT_MINUTES
+    breaks: tuple = ()  # sorted ((start, end), ...)
+
+
+DEFAULT_SCHEDULE = Schedule()
+
+
+class SlotGrid(NamedTuple):
+    times: tuple  # slot start times, ascending
+    labels: tuple  # the same times formatted with LABEL_FORMAT
+    index: frozenset  # for "is this time on the grid" checks
+    bits: tuple  # slot_bit() of each time
+
+
+def _minutes(t):
+    return t.hour * 60 + t.minute
+
+
+def slot_bit(t):
+    """Bit of a slot starting at `t` in a day's booked-slot bitmap."""
+    return 1 << _minutes(t)
+
+
+def bitmap_times(mask):
+    """Slot start times set in a booked-slot bitmap, ascending."""
+    return [time(minute // 60, minute % 60) for minute in range(mask.bit_length()) if mask >> minute & 1]
+
+
+@lru_cache(maxsize=1024)
+def slot_grid(day_start, day_end, slot_minutes=DEFAULT_SLOT_MINUTES, breaks=()):
+    """Slots of `slot_minutes` that fit in [day_start, day_end) without overlapping a break.
+
+    After a break the grid restarts at the break's end.
+    """
+    end = _minutes(day_end)
+    spans = [(_minutes(b_start), _minutes(b_end)) for b_start, b_end in breaks]
+    times = []
+    minute = _minutes(day_start)
+    while minute + slot_minutes <= end:
+        overlap = [b_end for b_start, b_end in spans if b_start < minute + slot_minutes and minute < b_end]
+        if overlap:
+            minute = max(overlap)
+            continue
+        times.append(time(minute // 60, minute % 60))
+        minute += slot_minutes
+    return SlotGrid(
+        tuple(times),
+        tuple(t.strftime(LABEL_FORMAT) for t in times),
+        frozenset(times),
+        tuple(slot_bit(t) for t in times),
+    )
+
+
+def day_grid(schedule, day):
+    """Grid for one DoctorAvailability row under `schedule`."""
+    return slot_grid(day.start_time, day.end_time, schedule.slot_minutes, schedule.breaks)
+
+
+def free_slot_days(available_days, occupied, schedule=DEFAULT_SCHEDULE):
+    """Build the [{date, slots}] payload; occupied maps date -> booked-slot bitmap."""
+    days = []
+    for day in available_days:
+        grid = day_grid(schedule, day)
+        mask = occupied.get(day.date)
+        if mask:
+            slots = [label for bit, label in zip(grid.bits, grid.labels) if not mask & bit]
+        else:
+            slots = list(grid.labels)
+        days.append({"date": day.date.isoformat(), "slots": slots})
+    return days
+
+
+def parse_breaks(value):
+    """Parse "HH:MM-HH:MM,..." into sorted ((start, end), ...). Raises ValueError."""
+    breaks = []
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_str, end_str = part.split("-")
+        start = datetime.strptime(start_str.strip(), "%H:%M").time()
+        end = datetime.strptime(end_str.strip(), "%H:%M").time()
+        if start >= end:
+            raise ValueError(f"break {part} must end after it starts")
+        breaks.append((start, end))
+    return tuple(sorted(breaks))
+
+
+def format_breaks(breaks):
+    return ",".join(f"{start.strftime('%H:%M')}-{end.strftime('%H:%M')}" for start, end in breaks)
+
+
+def schedule_as_dict(schedule):
+    return {
+        "day_start": schedule.day_start.strftime("%H:%M"),
+        "day_end": schedule.day_end.strftime("%H:%M"),
+        "slot_minutes": schedule.slot_minutes,
+        "breaks": format_breaks(schedule.breaks),
+    }
+
+
+def _merge(*rows):
+    """Schedule from working_hours rows, most specific first; NULL fields fall through."""
+    def pick(field, default):
+        for row in rows:
+            if row is not None and getattr(row, field) is not None:
+                return getattr(row, field)
+        return default
+
+    return Schedule(
+        pick("day_start", DEFAULT_DAY_START),
+        pick("day_end", DEFAULT_DAY_END),
+        pick("slot_minutes", DEFAULT_SLOT_MINUTES),
+        parse_breaks(pick("breaks", "")),
+    )
+
+
+def schedules_for(doctors):
+    """{doctor_id: Schedule} for an iterable of (doctor_id, department_id) pairs, in one query."""
+    doctors = list(doctors)
+    doctor_ids = {doctor_id for doctor_id, _ in doctors}
+    department_ids = {department_id for _, department_id in doctors if department_id is not None}
+    rows = WorkingHours.query.filter(
+        or_(WorkingHours.doctor_id.in_(doctor_ids), WorkingHours.department_id.in_(department_ids))
+    ).all() if doctors else []
+    by_doctor = {row.doctor_id: row for row in rows if row.doctor_id is not None}
+    by_department = {row.department_id: row for row in rows if row.department_id is not None}
+    return {
+        doctor_id: _merge(by_doctor.get(doctor_id), by_department.get(department_id))
+        for doctor_id, department_id in doctors
+    }
+
+
+def schedule_for(doctor_id):
+    """Schedule for one doctor, resolving their department in the same query."""
+    rows = (
+        db.session.query(WorkingHours)
+        .outerjoin(DoctorProfile, DoctorProfile.specialization_id == WorkingHours.department_id)
+        .filter(or_(WorkingHours.doctor_id == doctor_id, DoctorProfile.user_id == doctor_id))
+        .all()
+    )
+    doctor_row = next((row for row in rows if row.doctor_id == doctor_id), None)
+    department_row = next((row for row in rows if row.department_id is not None), None)
+    return _merge(doctor_row, department_row)
@@ -0,0 +1,91 @@
+# conftest.py
+"""Shared fixtures: a fresh app on a throwaway SQLite database for every test."""
+import json
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# importing app.py builds a module-level app; keep it off instance/hospital.db
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.gettempdir(), "hms-tests-import.db")
+os.environ["INIT_DB_ON_STARTUP"] = "0"
+
+import app as hms  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+from models import db, Department, User  # noqa: E402
+
+
+def reset_process_caches():
+    """Module-level caches outlive an app, and ids restart with every database."""
+    for cache in (hms.ACCOUNT_STATE, hms.FREE_SLOT_INDEX, hms.SLOT_OCCUPANCY.days, hms.SLOT_OCCUPANCY.doctors):
+        cache.clear()
+
+
+@pytest.fixture
+def app(tmp_path):
+    reset_process_caches()
+    flask_app = hms.create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'hospital.db'}",
+        "INIT_DB_ON_STARTUP": True,
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+        "task_always_eager": True,
+    })
+    yield flask_app
+    with flask_app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_headers(client):
+    r = client.post("/admin/login", json={"username": "admin@hms.com", "password": "admin123"})
+    return {"Authorization": "Bearer " + r.get_json()["access_token"]}
+
+
+def make_department(app, name="Cardiology"):
+    with app.app_context():
+        department = Department(name=name)
+        db.session.add(department)
+        db.session.commit()
+        return department.id
+
+
+def make_doctor(client, admin_headers, department_id, username="doctor@hms.com", days=14):
+    """Approved doctor available on each of the next `days` days; returns the user id."""
+    today = date.today()
+    r = client.post("/admin/doctors", headers=admin_headers, json={
+        "username": username,
+        "password": "doctor",
+        "specialization_id": department_id,
+        "approve": True,
+        "availability": json.dumps({str(today + timedelta(days=k)): True for k in range(1, days + 1)}),
+    })
+    assert r.status_code in (200, 201), r.get_json()
+    with client.application.app_context():
+        return User.query.filter_by(username=username).one().id
+
+
+def make_patients(app, count):
+    """`count` patients, as Authorization headers; tokens carry the claims /login issues."""
+    with app.app_context():
+        users = [
+            User(username=f"patient{i}@hms.com", password="!", role="patient", approve=True, blocked=False)
+            for i in range(count)
+        ]
+        db.session.add_all(users)
+        db.session.commit()
+        return [
+            {"Authorization": "Bearer " + create_access_token(
+                identity=user.username,
+                additional_claims={"user_id": user.id, "role": "patient", "redirect": "patient_dashboard"},
+            )}
+            for user in users
+        ]
@@ -0,0 +1,46 @@
+# test_admin_doctors.py
+"""GET /admin/doctors: a fixed number of queries however many doctors are listed."""
+from sqlalchemy import event
+
+from conftest import make_department, make_doctor
+from models import db
+
+
+def count_queries(app, request):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = request()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert response.status_code == 200, response.get_json()
+    return len(statements)
+
+
+def test_doctor_list_query_count_does_not_grow(app, client, admin_headers):
+    department_id = make_department(app)
+    list_doctors = lambda: client.get("/admin/doctors", headers=admin_headers)  # noqa: E731
+
+    for i in range(3):
+        make_doctor(client, admin_headers, department_id, username=f"doctor{i}@hms.com")
+    list_doctors()  # warm the account state cache for the admin token
+    few = count_queries(app, list_doctors)
+
+    for i in range(3, 20):
+        make_doctor(client, admin_headers, department_id, username=f"doctor{i}@hms.com")
+    list_doctors()
+    many = count_queries(app, list_doctors)
+
+    assert len(list_doctors().get_json()) == 20
+    assert 0 < few == many
+
+
+def test_doctor_list_rejects_a_bad_specialization(client, admin_headers):
+    response = client.get("/admin/doctors?specialization=abc", headers=admin_headers)
+    assert response.status_code == 400
@@ -0,0 +1,34 @@
+# test_booking_concurrency.py
+"""Concurrent bookings of one slot: exactly one wins (uq_appointments_booked_slot)."""
+import threading
+from collections import Counter
+from datetime import date, timedelta
+
+from conftest import make_department, make_doctor, make_patients
+from models import Appointment
+
+BOOKERS = 200
+
+
+def test_one_winner_for_a_contested_slot(app, client, admin_headers):
+    doctor_id = make_doctor(client, admin_headers, make_department(app))
+    patients = make_patients(app, BOOKERS)
+    slot = {"doctor_id": doctor_id, "date": str(date.today() + timedelta(days=3)), "time": "11:00 AM"}
+    start = threading.Barrier(BOOKERS)
+    statuses = []
+
+    def book(headers):
+        own_client = app.test_client()
+        start.wait()
+        statuses.append(own_client.post("/appointments/book", headers=headers, json=slot).status_code)
+
+    threads = [threading.Thread(target=book, args=(headers,)) for headers in patients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert Counter(statuses) == {201: 1, 409: BOOKERS - 1}
+    with app.app_context():
+        booked = Appointment.query.filter_by(doctor_id=doctor_id, status="Booked").count()
+    assert booked == 1
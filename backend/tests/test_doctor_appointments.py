@@ -0,0 +1,30 @@
+# test_doctor_appointments.py
+"""GET /doctor/appointments starts at today but keeps earlier visits that are still Booked."""
+from datetime import date, time, timedelta
+
+from conftest import make_department, make_doctor, make_patients
+from models import db, Appointment
+
+
+def test_past_booked_visits_stay_listed(app, client, admin_headers):
+    doctor_id = make_doctor(client, admin_headers, make_department(app))
+    make_patients(app, 1)
+    today = date.today()
+    with app.app_context():
+        rows = [
+            Appointment(doctor_id=doctor_id, patient_id=2, date=today - timedelta(days=3), time=time(11), status="Booked"),
+            Appointment(doctor_id=doctor_id, patient_id=2, date=today - timedelta(days=2), time=time(11), status="Completed"),
+            Appointment(doctor_id=doctor_id, patient_id=2, date=today + timedelta(days=1), time=time(11), status="Booked"),
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        open_past, completed, upcoming = (row.id for row in rows)
+    token = client.post("/login", json={"username": "doctor@hms.com", "password": "doctor"}).get_json()["access_token"]
+    headers = {"Authorization": "Bearer " + token}
+
+    listed = client.get("/doctor/appointments", headers=headers).get_json()["appointments"]
+    assert [a["id"] for a in listed] == [open_past, upcoming]
+
+    since = (today - timedelta(days=7)).isoformat()
+    history = client.get(f"/doctor/appointments?from={since}", headers=headers).get_json()["appointments"]
+    assert [a["id"] for a in history] == [open_past, completed, upcoming]
@@ -0,0 +1,52 @@
+# test_doctor_profile.py
+"""Profile saves must not roll doctor_availability back to an old availability map."""
+import json
+from datetime import date, time, timedelta
+
+from conftest import make_department, make_doctor
+from models import db, DoctorAvailability, DoctorProfile
+
+
+def doctor_headers(client, username="doctor@hms.com"):
+    r = client.post("/login", json={"username": username, "password": "doctor"})
+    return {"Authorization": "Bearer " + r.get_json()["access_token"]}
+
+
+def day_row(app, doctor_id, day):
+    with app.app_context():
+        row = DoctorAvailability.query.filter_by(doctor_id=doctor_id, date=day).one()
+        return row.available, row.start_time, row.end_time
+
+
+def test_admin_profile_save_keeps_the_doctors_own_hours(app, client, admin_headers):
+    doctor_id = make_doctor(client, admin_headers, make_department(app))
+    shortened, closed = date.today() + timedelta(days=2), date.today() + timedelta(days=3)
+    r = client.post("/doctor/availability", headers=doctor_headers(client), json={"availability": {
+        str(shortened): {"available": True, "start": "09:00", "end": "10:00"},
+        str(closed): False,
+    }})
+    assert r.status_code == 200
+
+    profile = client.get(f"/admin/doctors/{doctor_id}", headers=admin_headers).get_json()["profile"]
+    assert json.loads(profile["availability"])[str(shortened)] == {"available": True, "start": "09:00", "end": "10:00"}
+    r = client.post(f"/admin/doctors/{doctor_id}/profile", headers=admin_headers,
+                    json=dict(profile, experience="12 years"))
+    assert r.status_code == 200
+
+    assert day_row(app, doctor_id, shortened) == (True, time(9), time(10))
+    assert day_row(app, doctor_id, closed)[0] is False
+
+
+def test_legacy_profile_text_is_not_reapplied(app, client, admin_headers):
+    doctor_id = make_doctor(client, admin_headers, make_department(app))
+    closed = date.today() + timedelta(days=2)
+    legacy = json.dumps({str(closed): True})
+    with app.app_context():
+        DoctorProfile.query.filter_by(user_id=doctor_id).one().availability = legacy
+        db.session.commit()
+    client.post("/doctor/availability", headers=doctor_headers(client), json={"availability": {str(closed): False}})
+
+    r = client.post(f"/admin/doctors/{doctor_id}/profile", headers=admin_headers,
+                    json={"experience": "3 years", "availability": legacy})
+    assert r.status_code == 200
+    assert day_row(app, doctor_id, closed)[0] is False
@@ -0,0 +1,24 @@
+# test_monthly_activity.py
+"""The scheduled monthly report covers the month that just ended."""
+from datetime import datetime
+
+import app as hms
+from models import db, User
+
+
+class NewYearsMorning(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2026, 1, 1, 7, 0)
+
+
+def test_defaults_to_the_previous_month(app, monkeypatch):
+    monkeypatch.setattr(hms, "DateTime", NewYearsMorning)
+    monkeypatch.setattr(hms, "queue_mail_batches", lambda messages: messages)
+    with app.app_context():
+        db.session.add(User(username="doctor@hms.com", password="!", role="doctor", approve=True))
+        db.session.commit()
+        default = hms.monthly_doctor_activity.run()
+        chosen = hms.monthly_doctor_activity.run(2025, 6)
+    assert [m["subject"] for m in default] == ["Monthly Activity - December 2025"]
+    assert [m["subject"] for m in chosen] == ["Monthly Activity - June 2025"]
@@ -0,0 +1,61 @@
+# test_slot_cache.py
+"""SLOT_OCCUPANCY bitmaps stay equal to the appointments table through bookings and cancellations."""
+import random
+from datetime import datetime
+
+from conftest import make_department, make_doctor, make_patients
+from models import Appointment
+
+
+def availability(client, headers, doctor_id):
+    response = client.get(f"/doctor/{doctor_id}/availability", headers=headers)
+    assert response.status_code == 200
+    return {day["date"]: set(day["slots"]) for day in response.get_json()["availability"]}
+
+
+def test_bitmaps_match_the_database_after_random_bookings(app, client, admin_headers):
+    rng = random.Random(23)
+    department_id = make_department(app)
+    doctors = [make_doctor(client, admin_headers, department_id, username=f"doctor{i}@hms.com", days=5)
+               for i in range(2)]
+    patients = make_patients(app, 10)
+    grids = {doctor_id: availability(client, patients[0], doctor_id) for doctor_id in doctors}
+    booked = {}  # (doctor_id, date, label) -> patient index
+
+    for _ in range(300):
+        doctor_id = rng.choice(doctors)
+        if booked and rng.random() < 0.35:
+            key = rng.choice(sorted(booked))
+            patient = booked.pop(key)
+            slot_doctor, day, label = key
+            with app.app_context():
+                appt = Appointment.query.filter_by(
+                    doctor_id=slot_doctor, status="Booked",
+                    date=datetime.strptime(day, "%Y-%m-%d").date(),
+                    time=datetime.strptime(label, "%I:%M %p").time(),
+                ).one()
+            response = client.post(f"/patient/appointments/{appt.id}/cancel", headers=patients[patient])
+            assert response.status_code == 200
+        else:
+            day = rng.choice(sorted(grids[doctor_id]))
+            label = rng.choice(sorted(grids[doctor_id][day]))
+            patient = rng.randrange(len(patients))
+            response = client.post("/appointments/book", headers=patients[patient],
+                                   json={"doctor_id": doctor_id, "date": day, "time": label})
+            if (doctor_id, day, label) in booked:
+                assert response.status_code == 409
+            else:
+                assert response.status_code == 201, response.get_json()
+                booked[(doctor_id, day, label)] = patient
+        if rng.random() < 0.3:
+            availability(client, patients[0], rng.choice(doctors))  # fills the cache mid-run
+
+    for doctor_id in doctors:
+        free = availability(client, patients[0], doctor_id)
+        for day, slots in grids[doctor_id].items():
+            taken = {label for (d, booked_day, label) in booked if d == doctor_id and booked_day == day}
+            assert free[day] == slots - taken
+
+    report = client.get("/admin/slot-cache/verify", headers=admin_headers).get_json()
+    assert report["checked"] > 0
+    assert report["mismatches"] == []
@@ -0,0 +1,85 @@
+# test_sqlite_pragmas.py
+"""Mixed read/write throughput on SQLite with and without configure_sqlite's pragmas.
+
+Run with -s to see the numbers; only correctness is asserted, timings vary by machine.
+"""
+import threading
+import time
+from datetime import date, time as Time, timedelta
+
+from sqlalchemy import create_engine, func, insert, select, text
+
+import app as hms
+from models import Appointment
+
+READERS = 4
+WRITERS = 2
+SECONDS = 1.0
+
+
+def mixed_workload(engine):
+    """(reads, writes, errors) completed by READERS + WRITERS threads in SECONDS."""
+    table = Appointment.__table__
+    today = date.today()
+    with engine.begin() as conn:
+        table.create(conn)
+        conn.execute(insert(table), [
+            # 100 distinct slots per doctor, so uq_appointments_booked_slot holds
+            {"doctor_id": i % 50, "patient_id": i % 500, "date": today + timedelta(days=i // 50 % 60),
+             "time": Time(11 + i // 3000), "status": "Booked"}
+            for i in range(5000)
+        ])
+    availability = select(table.c.date, table.c.time).where(
+        table.c.doctor_id == 7, table.c.status == "Booked", table.c.date >= today,
+    )
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + SECONDS
+
+    def run(work, kind):
+        done = errors = 0
+        while time.perf_counter() < deadline:
+            try:
+                work()
+                done += 1
+            except Exception:
+                errors += 1
+        with lock:
+            counts[kind] += done
+            counts["errors"] += errors
+
+    def read():
+        with engine.connect() as conn:
+            conn.execute(availability).fetchall()
+
+    def write():
+        with engine.begin() as conn:
+            conn.execute(insert(table).values(
+                doctor_id=99, patient_id=1, date=today, time=Time(12), status="Cancelled",
+            ))
+
+    threads = [threading.Thread(target=run, args=(read, "reads")) for _ in range(READERS)]
+    threads += [threading.Thread(target=run, args=(write, "writes")) for _ in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with engine.connect() as conn:
+        written = conn.execute(select(func.count()).select_from(table).where(table.c.doctor_id == 99)).scalar()
+    assert written == counts["writes"]
+    return counts
+
+
+def test_mixed_read_write_throughput(app, tmp_path):
+    plain = create_engine(f"sqlite:///{tmp_path / 'plain.db'}")
+    tuned = create_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    hms.configure_sqlite(tuned, app.config)
+
+    before = mixed_workload(plain)
+    after = mixed_workload(tuned)
+    with tuned.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+    print(f"\nno pragmas: {before}\nwith pragmas: {after}")
+
+    assert after["errors"] == 0
+    assert after["reads"] and after["writes"]
@@ -43,6 +43,12 @@ export default {
         <canvas id="statusChart" width="400" height="250"></canvas>
       </div>
     </div>
+
+    <div class="text-center mt-3" v-if="nextCursor">
+      <button class="btn btn-outline-primary" @click="fetchAppointments(nextCursor)">
+        Load more appointments
+      </button>
+    </div>
   </div>
   `,
 
@@ -57,13 +63,15 @@ export default {
         upcoming_appointments: 0
       },
       appointments: [],
+      nextCursor: null,
       appointmentsChart: null,
       statusChart: null
     };
   },
 
-  mounted() {
-    this.fetchDashboardStats();
+  async mounted() {
+    // stats first: the status chart is drawn from its per-status breakdown
+    await this.fetchDashboardStats();
     this.fetchAppointments();
   },
 
@@ -84,16 +92,19 @@ export default {
       }
     },
 
-    async fetchAppointments() {
+    async fetchAppointments(cursor = null) {
       try {
-        const res = await fetch(`${location.origin}/admin/appointments`, {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const res = await fetch(`${location.origin}/admin/appointments${query}`, {
           headers: { 
             'Authorization': 'Bearer ' + localStorage.getItem('token')
           }
         });
         if (!res.ok) throw new Error('Failed to fetch appointments');
         const data = await res.json();
-        this.appointments = data;
+        // paginated: { appointments, next_cursor }
+        this.appointments = cursor ? this.appointments.concat(data.appointments) : data.appointments;
+        this.nextCursor = data.next_cursor;
 
         this.renderCharts();
       } catch (err) {
@@ -134,11 +145,8 @@ export default {
         }
       });
 
-      // Chart 2: Appointments by status
-      const statusGrouped = {};
-      this.appointments.forEach(a => {
-        statusGrouped[a.status] = (statusGrouped[a.status] || 0) + 1;
-      });
+      // Chart 2: Appointments by status (all appointments, from /admin/dashboard)
+      const statusGrouped = this.stats.appointments_by_status || {};
       const sLabels = Object.keys(statusGrouped);
       const sCounts = Object.values(statusGrouped);
 
@@ -79,6 +79,9 @@ export default {
           </tr>
         </tbody>
       </table>
+      <div class="text-center" v-if="nextCursor">
+        <button class="btn btn-outline-primary btn-sm" @click="fetchAppointments(nextCursor)">Load more</button>
+      </div>
     </div>
   </div>
   `,
@@ -88,6 +91,7 @@ export default {
       doctors: [],
       patients: [],
       appointments: [],
+      nextCursor: null,
       message: null,
       category: null
     };
@@ -126,14 +130,16 @@ export default {
       }
     },
 
-    async fetchAppointments() {
+    async fetchAppointments(cursor = null) {
       try {
-        const res = await fetch(`${location.origin}/admin/appointments`, {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const res = await fetch(`${location.origin}/admin/appointments${query}`, {
           headers: { 'Authorization': 'Bearer ' + localStorage.getItem('token') }
         });
         if (!res.ok) throw new Error('Failed to fetch appointments');
         const data = await res.json();
-        this.appointments = data;
+        this.appointments = cursor ? this.appointments.concat(data.appointments) : data.appointments;
+        this.nextCursor = data.next_cursor;
       } catch (err) {
         console.error(err);
       }
@@ -1,3 +1,5 @@
+import cachedFetch from "../utils/cachedFetch.js";
+
 export default {
   template: `
     <div class="container mt-4">
@@ -125,7 +127,7 @@ export default {
   methods: {
     async fetchDepartments() {
       try {
-        const res = await fetch(`${location.origin}/departments`, {
+        const res = await cachedFetch(`${location.origin}/departments`, {
           headers: { Authorization: 'Bearer ' + localStorage.getItem('token') }
         });
         if (res.ok) this.departments = await res.json();
@@ -1,3 +1,5 @@
+import { openSlotEvents, removeSlot } from "../utils/slotEvents.js";
+
 export default {
   template: `
     <div class="container mt-4">
@@ -15,6 +17,21 @@ export default {
           {{ message }}
         </div>
 
+        <h4 class="mt-4">Next Available</h4>
+        <div v-if="nextSlots.length === 0" class="text-muted mb-3">No open slots in the coming weeks.</div>
+        <ul v-else class="list-group mb-3">
+          <li
+            v-for="slot in nextSlots"
+            :key="slot.doctor_id + ' ' + slot.date + ' ' + slot.time"
+            class="list-group-item d-flex justify-content-between align-items-center"
+          >
+            <span>{{ slot.date }} {{ slot.time }} &mdash; Dr. {{ slot.doctor_name }}</span>
+            <button class="btn btn-sm btn-outline-success" @click="bookSlot(slot.date, slot.time, slot.doctor_id)">
+              Book
+            </button>
+          </li>
+        </ul>
+
         <h4 class="mt-4">Doctors in this Department</h4>
         <table class="table table-bordered align-middle">
           <thead>
@@ -64,9 +81,7 @@ export default {
                       <button
                         v-for="slot in day.slots"
                         :key="slot"
-                        class="btn btn-sm"
-                        :class="isSlotBooked(day.date, slot) ? 'btn-secondary disabled' : 'btn-outline-success'"
-                        :disabled="isSlotBooked(day.date, slot)"
+                        class="btn btn-sm btn-outline-success"
                         @click="bookSlot(day.date, slot)"
                       >
                         {{ slot }}
@@ -98,77 +113,82 @@ export default {
       category: null,
       selectedDoctor: null,
       availableSlots: [],
-      bookedAppointments: [], // Track booked slots
+      nextSlots: [],
+      events: null,
     };
   },
 
   async mounted() {
-    const deptId = this.$route.params.id;
-    try {
-      const res = await fetch(`${location.origin}/departments/${deptId}`, {
-        headers: { Authorization: "Bearer " + localStorage.getItem("token") },
-      });
-      const data = await res.json();
-
-      if (res.ok) {
-        this.department = data.department;
-        this.doctors = data.doctors;
-      } else {
-        this.message = data.message || "Failed to load department details.";
-        this.category = "danger";
-      }
-    } catch (err) {
-      console.error(err);
-      this.message = "Error fetching department details.";
-      this.category = "danger";
-    } finally {
-      this.loading = false;
-    }
+    await Promise.all([this.fetchDepartment(), this.fetchNextSlots()]);
+    this.loading = false;
+    // keep the lists current while the page is open instead of polling
+    this.events = openSlotEvents(`/departments/${this.$route.params.id}/slot-events`, {
+      onBooked: (e) => this.slotBooked(e),
+      onChange: () => Promise.all([this.fetchDepartment(), this.fetchNextSlots()]),
+    });
   },
 
-  methods: {
-    /** Fetch available slots for selected doctor **/
-    async openBooking(doctor) {
-      this.selectedDoctor = doctor;
-      this.availableSlots = [];
-      this.bookedAppointments = [];
+  beforeDestroy() {
+    if (this.events) this.events.close();
+  },
 
+  methods: {
+    /** Fetch department, its doctors and their free slots in one request **/
+    async fetchDepartment() {
+      const deptId = this.$route.params.id;
       try {
-        const res = await fetch(`${location.origin}/doctor/${doctor.id}/availability`, {
+        const res = await fetch(`${location.origin}/departments/${deptId}/availability`, {
           headers: { Authorization: "Bearer " + localStorage.getItem("token") },
         });
         const data = await res.json();
 
         if (res.ok) {
-          // backend should return: { availability: [{ date, slots: [...] }] }
-          this.availableSlots = data.availability || [];
-
-          // Also fetch booked appointments to disable them
-          const bookedRes = await fetch(`${location.origin}/doctor/${doctor.id}/appointments`, {
-            headers: { Authorization: "Bearer " + localStorage.getItem("token") },
-          });
-          if (bookedRes.ok) {
-            const bookedData = await bookedRes.json();
-            this.bookedAppointments = bookedData.appointments || [];
-          }
+          // backend returns: { department, doctors: [{ id, name, experience, availability: [{ date, slots }] }] }
+          this.department = data.department;
+          this.doctors = data.doctors;
         } else {
-          this.message = data.message || "Failed to load availability.";
+          this.message = data.message || "Failed to load department details.";
           this.category = "danger";
         }
       } catch (err) {
         console.error(err);
-        this.message = "Error loading availability.";
+        this.message = "Error fetching department details.";
         this.category = "danger";
       }
     },
 
-    /** Check if slot already booked **/
-    isSlotBooked(date, time) {
-      return this.bookedAppointments.some(a => a.date === date && a.time === time);
+    /** Earliest free slots across all doctors of the department **/
+    async fetchNextSlots() {
+      const deptId = this.$route.params.id;
+      try {
+        const res = await fetch(`${location.origin}/departments/${deptId}/next-available?limit=5`, {
+          headers: { Authorization: "Bearer " + localStorage.getItem("token") },
+        });
+        if (res.ok) {
+          this.nextSlots = (await res.json()).slots;
+        }
+      } catch (err) {
+        console.error(err);
+      }
+    },
+
+    /** Another booking took a slot: drop it from the lists shown **/
+    slotBooked({ doctor_id, date, time }) {
+      const doctor = this.doctors.find((d) => d.id === doctor_id);
+      if (doctor) removeSlot(doctor.availability || [], date, time);
+      this.nextSlots = this.nextSlots.filter(
+        (s) => !(s.doctor_id === doctor_id && s.date === date && s.time === time)
+      );
+    },
+
+    /** Show the free slots already loaded for the selected doctor **/
+    openBooking(doctor) {
+      this.selectedDoctor = doctor;
+      this.availableSlots = doctor.availability || [];
     },
 
     /** Book selected slot **/
-    async bookSlot(date, time) {
+    async bookSlot(date, time, doctorId = this.selectedDoctor.id) {
       if (!confirm(`Book appointment on ${date} at ${time}?`)) return;
 
       try {
@@ -179,7 +199,7 @@ export default {
             Authorization: "Bearer " + localStorage.getItem("token"),
           },
           body: JSON.stringify({
-            doctor_id: this.selectedDoctor.id,
+            doctor_id: doctorId,
             date,
             time,
           }),
@@ -191,6 +211,7 @@ export default {
 
         if (res.ok) {
           this.closeBooking();
+          await Promise.all([this.fetchDepartment(), this.fetchNextSlots()]); // refresh free slots
         }
       } catch (err) {
         console.error(err);
@@ -203,7 +224,6 @@ export default {
     closeBooking() {
       this.selectedDoctor = null;
       this.availableSlots = [];
-      this.bookedAppointments = [];
     },
   },
 };
@@ -16,7 +16,14 @@ export default {
           class="form-control"
           placeholder="Search by date, time, or status"
         />
-        <button class="btn btn-primary" @click="fetchAppointments">
+        <input
+          type="date"
+          v-model="fromDate"
+          class="form-control"
+          title="Show history from this date"
+          @change="fetchAppointments()"
+        />
+        <button class="btn btn-primary" @click="fetchAppointments()">
           Refresh
         </button>
       </div>
@@ -48,15 +55,24 @@ export default {
       <div v-else class="text-muted text-center mt-4">
         No appointments found.
       </div>
+
+      <div class="text-center" v-if="nextCursor">
+        <button class="btn btn-outline-primary" @click="fetchAppointments(nextCursor)">
+          Load more
+        </button>
+      </div>
     </div>
   `,
 
   data() {
     return {
       appointments: [],
+      nextCursor: null,
       message: null,
       category: null,
       searchQuery: "",
+      // empty: open visits plus today onward; a date reaches back into history
+      fromDate: "",
     };
   },
 
@@ -75,10 +91,14 @@ export default {
   },
 
   methods: {
-    async fetchAppointments() {
+    async fetchAppointments(cursor = null) {
       this.message = null;
       try {
-        const res = await fetch(`${location.origin}/doctor/appointments`, {
+        const params = new URLSearchParams();
+        if (cursor) params.set("cursor", cursor);
+        if (this.fromDate) params.set("from", this.fromDate);
+        const query = params.toString() ? `?${params}` : "";
+        const res = await fetch(`${location.origin}/doctor/appointments${query}`, {
           method: "GET",
           headers: {
             Authorization: "Bearer " + localStorage.getItem("token"),
@@ -86,7 +106,10 @@ export default {
         });
 
         if (res.ok) {
-          this.appointments = await res.json();
+          // paginated: { appointments, next_cursor }
+          const data = await res.json();
+          this.appointments = cursor ? this.appointments.concat(data.appointments) : data.appointments;
+          this.nextCursor = data.next_cursor;
           if (!this.appointments.length) {
             this.message = "No appointments available.";
             this.category = "info";
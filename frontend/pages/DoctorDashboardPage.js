@@ -47,6 +47,10 @@ export default {
         </tr>
       </tbody>
     </table>
+
+    <div class="text-center" v-if="nextCursor">
+      <button class="btn btn-outline-primary btn-sm" @click="fetchAppointments(nextCursor)">Load more</button>
+    </div>
   </div>
   `,
 
@@ -55,6 +59,7 @@ export default {
       message: null,
       category: null,
       appointments: [],
+      nextCursor: null,
       patients: {},
     };
   },
@@ -64,7 +69,7 @@ export default {
   },
 
   methods: {
-    async fetchAppointments() {
+    async fetchAppointments(cursor = null) {
       try {
         const token = localStorage.getItem('token');
         if (!token) {
@@ -73,13 +78,15 @@ export default {
           return;
         }
 
-        const res = await fetch(`${location.origin}/doctor/appointments`, {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+        const res = await fetch(`${location.origin}/doctor/appointments${query}`, {
           headers: { Authorization: `Bearer ${token}` },
         });
 
         if (!res.ok) throw new Error("Failed to fetch appointments");
         const data = await res.json();
-        this.appointments = data;
+        this.appointments = cursor ? this.appointments.concat(data.appointments) : data.appointments;
+        this.nextCursor = data.next_cursor;
 
         // Fetch patient names for mapping
         await this.fetchPatients();
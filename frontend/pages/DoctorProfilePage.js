@@ -1,3 +1,5 @@
+import cachedFetch from "../utils/cachedFetch.js";
+
 export default {
   template: `
   <div class="row">
@@ -95,7 +97,7 @@ export default {
     /** Fetch specialization names **/
     async fetchSpecializations() {
       try {
-        const res = await fetch(`${location.origin}/departments`);
+        const res = await cachedFetch(`${location.origin}/departments`);
         if (res.ok) {
           this.specializationOptions = await res.json();
         }
@@ -40,6 +40,9 @@ export default {
           </tr>
         </tbody>
       </table>
+      <button class="btn btn-outline-primary btn-sm" v-if="nextCursor" @click="fetchAppointments(nextCursor)">
+        Load more
+      </button>
     </div>
 
     <!-- Chart -->
@@ -52,6 +55,7 @@ export default {
     return {
       appointmentsChart: null,
       appointments: [],
+      nextCursor: null,
       message: null,
       category: null,
     };
@@ -67,18 +71,21 @@ export default {
       };
     },
 
-    async fetchAppointments() {
+    async fetchAppointments(cursor = null) {
       try {
-        const response = await fetch(`${location.origin}/patient/appointments`, {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+        const response = await fetch(`${location.origin}/patient/appointments${query}`, {
           headers: { "Authorization": "Bearer " + localStorage.getItem("token") }
         });
 
         if (!response.ok) throw new Error("Failed to fetch appointments");
 
+        // paginated: { appointments, next_cursor }
         const data = await response.json();
-        this.appointments = data;
+        this.appointments = cursor ? this.appointments.concat(data.appointments) : data.appointments;
+        this.nextCursor = data.next_cursor;
 
-        if (data.length === 0) {
+        if (this.appointments.length === 0) {
           this.message = "No appointments found.";
           this.category = "info";
           this.updateAppointmentsChart([], []);
@@ -86,7 +93,7 @@ export default {
         }
 
         const grouped = {};
-        data.forEach(a => {
+        this.appointments.forEach(a => {
           grouped[a.date] = (grouped[a.date] || 0) + 1;
         });
 
@@ -1,3 +1,6 @@
+import cachedFetch from "../utils/cachedFetch.js";
+import { openSlotEvents, removeSlot } from "../utils/slotEvents.js";
+
 export default {
   template: `
   <div class="container mt-4">
@@ -50,18 +53,28 @@ export default {
       loading: true,
       message: null,
       category: null,
+      events: null,
     };
   },
 
   async mounted() {
     this.doctorId = this.$route.params.id;
     await this.fetchAvailability();
+    // slots booked by other patients disappear without polling
+    this.events = openSlotEvents(`/doctor/${this.doctorId}/slot-events`, {
+      onBooked: (e) => removeSlot(this.availability, e.date, e.time),
+      onChange: () => this.fetchAvailability(),
+    });
+  },
+
+  beforeDestroy() {
+    if (this.events) this.events.close();
   },
 
   methods: {
     async fetchAvailability() {
       try {
-        const res = await fetch(`${location.origin}/doctor/${this.doctorId}/availability`, {
+        const res = await cachedFetch(`${location.origin}/doctor/${this.doctorId}/availability`, {
           headers: { Authorization: "Bearer " + localStorage.getItem("token") },
         });
         const data = await res.json();
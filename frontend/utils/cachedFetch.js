@@ -0,0 +1,43 @@
+// fetch() for GET endpoints that send an ETag (departments, doctor availability).
+// The last ETag and body per URL are kept in sessionStorage; the next request
+// sends If-None-Match and a 304 is answered from the stored body, so callers
+// always see a normal 200 response.
+const PREFIX = "etag:";
+
+function load(url) {
+  try {
+    return JSON.parse(sessionStorage.getItem(PREFIX + url));
+  } catch (err) {
+    return null;
+  }
+}
+
+function store(url, etag, body) {
+  try {
+    sessionStorage.setItem(PREFIX + url, JSON.stringify({ etag, body }));
+  } catch (err) {
+    // storage full or disabled: just skip caching
+  }
+}
+
+export default async function cachedFetch(url, options = {}) {
+  const saved = load(url);
+  const headers = { ...(options.headers || {}) };
+  if (saved) headers["If-None-Match"] = saved.etag;
+
+  // no-store keeps the browser's own HTTP cache out of the way so a 304 reaches us
+  const res = await fetch(url, { ...options, headers, cache: "no-store" });
+
+  if (res.status === 304 && saved) {
+    return new Response(saved.body, {
+      status: 200,
+      headers: { "Content-Type": "application/json", ETag: saved.etag },
+    });
+  }
+
+  const etag = res.headers.get("ETag");
+  if (res.ok && etag) {
+    store(url, etag, await res.clone().text());
+  }
+  return res;
+}
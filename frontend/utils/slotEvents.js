@@ -0,0 +1,79 @@
+// Live slot updates from /doctor/<id>/slot-events or /departments/<id>/slot-events.
+// "booked" events carry { doctor_id, date, time } and can be applied in place;
+// "freed", "changed" and "resync" mean the page should refetch its slots.
+// EventSource cannot send headers, so each connection opens with a short-lived
+// stream token from /slot-events/token rather than the access token. A stream
+// token expires, so after a dropped connection a fresh one is fetched before
+// reconnecting; onChange also runs after each reconnect so nothing missed
+// while disconnected is lost. Bursts of onChange calls are coalesced into one
+// refetch.
+const RECONNECT_MS = 5000;
+
+async function streamToken() {
+  const res = await fetch(`${location.origin}/slot-events/token`, {
+    method: "POST",
+    headers: { Authorization: "Bearer " + localStorage.getItem("token") },
+  });
+  if (!res.ok) throw new Error(`stream token: ${res.status}`);
+  return (await res.json()).token;
+}
+
+export function openSlotEvents(path, { onBooked, onChange: refetch }) {
+  let source = null;
+  let closed = false;
+  let connected = false;
+  let pending = null;
+  let retry = null;
+  const onChange = () => {
+    clearTimeout(pending);
+    pending = setTimeout(refetch, 300);
+  };
+
+  const reconnect = () => {
+    clearTimeout(retry);
+    retry = setTimeout(connect, RECONNECT_MS);
+  };
+
+  async function connect() {
+    if (closed) return;
+    let token;
+    try {
+      token = await streamToken();
+    } catch (e) {
+      reconnect();
+      return;
+    }
+    if (closed) return;
+    source = new EventSource(`${location.origin}${path}?token=${encodeURIComponent(token)}`);
+    source.addEventListener("open", () => {
+      if (connected) onChange();
+      connected = true;
+    });
+    source.addEventListener("error", () => {
+      source.close();
+      reconnect();
+    });
+    source.addEventListener("booked", (e) => onBooked(JSON.parse(e.data)));
+    for (const name of ["freed", "changed", "resync"]) {
+      source.addEventListener(name, () => onChange());
+    }
+  }
+
+  connect();
+  return {
+    close() {
+      closed = true;
+      clearTimeout(pending);
+      clearTimeout(retry);
+      if (source) source.close();
+    },
+  };
+}
+
+// Drop one booked slot from an [{ date, slots }] list, in place.
+export function removeSlot(days, date, time) {
+  const day = days.find((d) => d.date === date);
+  if (!day) return;
+  const i = day.slots.indexOf(time);
+  if (i !== -1) day.slots.splice(i, 1);
+}